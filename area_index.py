@@ -0,0 +1,82 @@
+"""地域検索の索引
+
+areas テーブルの名前・コード・英語名・読み（かな）から前方一致の索引を作っておき、
+入力のたびに表を引くだけで候補を返す。地域名は短いので、名前の途中から始まる語も入れておく。
+"""
+import unicodedata
+from collections import namedtuple
+
+from weather_db import load_area_search_entries
+
+# 索引に入れる地域の種類（オフィス、一次細分区域、市町村）
+SEARCH_AREA_TYPES = ("office", "class10", "class20")
+
+# 検索結果の1件（code は選択したときに開く地域のコード、細分区域の parent_code はオフィスのコード）
+AreaEntry = namedtuple("AreaEntry", "code name en_name kana parent_code area_type")
+
+# 名前を語に分ける区切り文字（「石狩・空知・後志地方」を「空知」でも引けるように）
+_SEPARATORS = ("・", "　", " ", "-", "/")
+
+# 入力1文字から索引を引く（0文字では何も返さない）
+MIN_QUERY_LENGTH = 1
+
+
+def normalize(text):
+    """検索用に正規化（全角英数→半角、小文字、カタカナ→ひらがな）"""
+    text = unicodedata.normalize("NFKC", text or "").lower().strip()
+    return "".join(
+        chr(ord(ch) - 0x60) if "ァ" <= ch <= "ヶ" else ch
+        for ch in text
+    )
+
+
+def _terms(entry):
+    """1件の地域から索引に入れる語"""
+    terms = {entry.code}
+    for text in (entry.name, entry.en_name, entry.kana):
+        text = normalize(text)
+        if not text:
+            continue
+        terms.add(text)
+        for separator in _SEPARATORS:
+            if separator in text:
+                terms.update(part for part in text.split(separator) if part)
+    # 日本語の名前は途中からでも引けるようにする（「本島」で「沖縄本島地方」）
+    name = normalize(entry.name)
+    terms.update(name[start:] for start in range(1, len(name)))
+    return terms
+
+
+class AreaIndex:
+    """前方一致の索引（語の各接頭辞 -> 該当する地域の番号）"""
+
+    def __init__(self, entries):
+        self.entries = [AreaEntry(*entry) for entry in entries]
+        prefixes = {}
+        for number, entry in enumerate(self.entries):
+            for term in _terms(entry):
+                for end in range(1, len(term) + 1):
+                    prefixes.setdefault(term[:end], set()).add(number)
+        # 結果はコード順に並べておく（入力のたびにソートしない）
+        self._prefixes = {prefix: tuple(sorted(numbers)) for prefix, numbers in prefixes.items()}
+
+    @classmethod
+    def from_db(cls, area_types=SEARCH_AREA_TYPES, excluded_offices=()):
+        """DBの地域から索引を作る（excluded_offices のオフィスに含まれる細分区域は入れない）"""
+        return cls(load_area_search_entries(area_types, excluded_offices))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query, limit=20):
+        """入力の前方一致で地域を探す（スペース区切りの語はすべてに一致するもの）"""
+        words = [normalize(word) for word in (query or "").split()]
+        words = [word for word in words if len(word) >= MIN_QUERY_LENGTH]
+        if not words:
+            return []
+
+        numbers = self._prefixes.get(words[0], ())
+        for word in words[1:]:
+            found = set(self._prefixes.get(word, ()))
+            numbers = tuple(n for n in numbers if n in found)
+        return [self.entries[n] for n in numbers[:limit]]
@@ -0,0 +1,370 @@
+"""天気予報の処理のベンチマーク（オフラインで実行できる）
+
+benchmarks/fixtures/ の気象庁形式のJSONと、長い履歴を持つ合成DBを使って、
+解析・保存・最新の予報の読み込み・過去の予報の読み込みの速さを測る。
+保存済みの基準値（baseline.json）と比べて、遅くなった処理を表示する。
+解析は jma_parser 以前の実装（parse_legacy）とも比べる。
+
+使い方:
+    python benchmarks/bench_weather.py                  # 測定して基準値と比較
+    python benchmarks/bench_weather.py --save-baseline  # 測定結果を基準値として保存
+    python benchmarks/bench_weather.py --check          # 基準値より遅ければ終了コード1
+    python benchmarks/bench_weather.py --days 365 --areas 40
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jma_parser  # noqa: E402
+import weather_analytics  # noqa: E402
+import weather_db  # noqa: E402
+from weather_codes import classify, classify_text  # noqa: E402
+from weather_service import parse_forecast_data  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCH_DIR, "fixtures")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+# 基準値の中央値よりこの割合以上遅ければ遅くなったとみなす
+REGRESSION_THRESHOLD = 0.25
+
+# 合成履歴の1日あたりの取得回数（気象庁の発表は1日3回）
+RUNS_PER_DAY = 3
+
+
+def load_fixtures(fixture_dir=FIXTURE_DIR):
+    """forecast_*.json を読み込む（地域コード -> JSON）"""
+    fixtures = {}
+    for name in sorted(os.listdir(fixture_dir)):
+        if name.startswith("forecast_") and name.endswith(".json"):
+            with open(os.path.join(fixture_dir, name), encoding="utf-8") as f:
+                fixtures[name[len("forecast_"):-len(".json")]] = json.load(f)
+    return fixtures
+
+
+def parse_forecast_data_legacy(forecast_data):
+    """jma_parser 以前の parse_forecast_data（解析の速さの比較用にそのまま残す）"""
+    weather_dict = {}
+
+    if not forecast_data or len(forecast_data) == 0:
+        return weather_dict
+
+    def day(date_str):
+        if date_str not in weather_dict:
+            weather_dict[date_str] = {
+                "weather": None, "weather_code": None, "temp_min": None, "temp_max": None,
+            }
+        return weather_dict[date_str]
+
+    def to_int(value):
+        try:
+            return int(value)
+        except (ValueError, TypeError):
+            return None
+
+    for forecast_item in forecast_data:
+        time_series = forecast_item.get("timeSeries", [])
+
+        for ts in time_series:
+            time_defines = ts.get("timeDefines", [])
+            areas = ts.get("areas", [])
+
+            if not areas:
+                continue
+
+            area = areas[0]
+
+            # 天気情報の取得（週間予報は天気コードのみ）
+            weathers = area.get("weathers", [])
+            weather_codes = area.get("weatherCodes", [])
+            if weathers or weather_codes:
+                for i, time_def in enumerate(time_defines):
+                    entry = day(time_def[:10])
+                    if i < len(weathers):
+                        entry["weather"] = weathers[i]
+                    if i < len(weather_codes) and to_int(weather_codes[i]) is not None:
+                        entry["weather_code"] = to_int(weather_codes[i])
+
+            # 気温情報の取得（temps配列 - 短期予報用）
+            temps = area.get("temps", [])
+            if temps and len(time_defines) > 0:
+                for i, time_def in enumerate(time_defines):
+                    if i >= len(temps):
+                        continue
+                    temp_val = to_int(temps[i])
+                    if temp_val is None:
+                        continue
+                    entry = day(time_def[:10])
+                    if entry["temp_min"] is None or temp_val < entry["temp_min"]:
+                        entry["temp_min"] = temp_val
+                    if entry["temp_max"] is None or temp_val > entry["temp_max"]:
+                        entry["temp_max"] = temp_val
+
+            # tempsMin/tempsMax（週間予報用）
+            temps_min = area.get("tempsMin", [])
+            temps_max = area.get("tempsMax", [])
+
+            if temps_min or temps_max:
+                for i, time_def in enumerate(time_defines):
+                    entry = day(time_def[:10])
+                    if i < len(temps_min) and to_int(temps_min[i]) is not None:
+                        entry["temp_min"] = to_int(temps_min[i])
+                    if i < len(temps_max) and to_int(temps_max[i]) is not None:
+                        entry["temp_max"] = to_int(temps_max[i])
+
+    return weather_dict
+
+
+def check_weather_icons(fixtures):
+    """解析した日ごとに、天気コードのアイコンと天気の文言の分類が一致するか確かめる
+
+    一致しない [(地域コード, 日付, 天気コード, 文言), ...] を返す（カードに別々の予報の
+    アイコンと文言が並ぶのを防ぐ）。
+    """
+    mismatches = []
+    for data in fixtures.values():
+        for code, region in jma_parser.summarize_daily(data).items():
+            for date_str, day in sorted(region["days"].items()):
+                if day["weather"] is None or day["weather_code"] is None:
+                    continue
+                if classify(day["weather_code"]).category != classify_text(day["weather"]).category:
+                    mismatches.append((code, date_str, day["weather_code"], day["weather"]))
+    return mismatches
+
+
+def percentile(sorted_values, p):
+    """ソート済みの値の p パーセンタイル（最近傍法）"""
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings):
+    """1回ごとの所要時間（秒）から処理速度と分位点（ミリ秒）を求める"""
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        "count": len(timings),
+        "ops_per_sec": len(timings) / total if total else 0.0,
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000,
+    }
+
+
+def measure(func, args_list, setup=None):
+    """args_list の引数ごとに func を呼び、それぞれの所要時間を返す（setup は測定に含めない）"""
+    timings = []
+    for args in args_list:
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def vary_forecast(weather_data, rng, fetched):
+    """予報を取得日時にずらし、気温と天気を少し変えた合成データを作る"""
+    start = fetched.date()
+    varied = {}
+    for offset, (date_str, day) in enumerate(sorted(weather_data.items())):
+        day = dict(day)
+        if day["temp_min"] is not None:
+            day["temp_min"] += rng.randint(-2, 2)
+        if day["temp_max"] is not None:
+            day["temp_max"] += rng.randint(-2, 2)
+        if rng.random() < 0.2:
+            day["weather_code"] = rng.choice((100, 101, 200, 201, 300))
+        varied[(start + timedelta(days=offset)).isoformat()] = day
+    return varied
+
+
+def synthetic_areas(parsed, count):
+    """フィクスチャの予報を使い回して count 地域分の (コード, 名前, 予報) を作る"""
+    sources = sorted(parsed.items())
+    return [
+        (f"9{i:05d}", f"合成地域{i}", sources[i % len(sources)][1])
+        for i in range(count)
+    ]
+
+
+def build_history(areas, days, end, rng):
+    """areas の days 日分の取得履歴を現在のDBに書き込む"""
+    start = end - timedelta(days=days)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for day in range(days):
+            for run in range(RUNS_PER_DAY):
+                fetched = start + timedelta(days=day, hours=5 + 6 * run)
+                fetched_at = fetched.strftime("%Y-%m-%d %H:%M:%S")
+                weather_db.save_forecasts_bulk(
+                    (code, name, vary_forecast(data, rng, fetched), fetched_at)
+                    for code, name, data in areas
+                )
+    return start
+
+
+def bench_parse(fixtures, iterations):
+    calls = [(data,) for data in fixtures.values()] * max(1, iterations // len(fixtures))
+    return {
+        "parse": summarize(measure(parse_forecast_data, calls)),
+        "parse_legacy": summarize(measure(parse_forecast_data_legacy, calls)),
+        "parse_records": summarize(measure(jma_parser.parse_forecast, calls)),
+    }
+
+
+def bench_save(areas, iterations, rng):
+    """空のDBに1地域ずつ保存する（毎回少しずつ違う予報）"""
+    fetched = datetime(2026, 1, 1, 5)
+    calls = []
+    for i in range(iterations):
+        code, name, data = areas[i % len(areas)]
+        when = fetched + timedelta(hours=6 * (i // len(areas)))
+        calls.append((code, name, vary_forecast(data, rng, when), when.strftime("%Y-%m-%d %H:%M:%S")))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {"save": summarize(measure(weather_db.save_forecast_to_db, calls))}
+
+
+def bench_queries(areas, start, days, iterations, rng):
+    """履歴のあるDBから最新の予報と過去の日付の予報を読む"""
+    codes = [code for code, _, _ in areas]
+    latest = [(rng.choice(codes),) for _ in range(iterations)]
+    history = [
+        (rng.choice(codes), (start + timedelta(days=rng.randrange(days))).strftime("%Y-%m-%d"))
+        for _ in range(iterations)
+    ]
+    # 同じ地域・日付を何度も見る場合（日付の選択を行き来するなど）
+    repeated = [rng.choice(history[:50]) for _ in range(iterations)]
+    # 読み取りキャッシュを毎回空にしてDBからの読み込みを測り、キャッシュありの場合と分けて表示する
+    cold = weather_db.clear_query_cache
+    return {
+        "latest": summarize(measure(weather_db.get_forecasts_from_db, latest, cold)),
+        "history": summarize(measure(weather_db.get_forecasts_from_db, history, cold)),
+        "latest_cached": summarize(measure(weather_db.get_forecasts_from_db, latest)),
+        "history_cached": summarize(measure(weather_db.get_forecasts_from_db, repeated)),
+    }
+
+
+def run_benchmarks(days, area_count, iterations, seed):
+    fixtures = load_fixtures()
+    if not fixtures:
+        raise SystemExit(f"フィクスチャがありません: {FIXTURE_DIR}")
+    parsed = {code: parse_forecast_data(data) for code, data in fixtures.items()}
+    areas = synthetic_areas(parsed, area_count)
+    rng = random.Random(seed)
+
+    results = bench_parse(fixtures, iterations)
+
+    work_dir = tempfile.mkdtemp(prefix="weather-bench-")
+    original_path = weather_db.DB_PATH
+    try:
+        weather_db.DB_PATH = os.path.join(work_dir, "save.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            weather_db.init_database()
+            weather_analytics.register()
+        results.update(bench_save(areas, iterations, rng))
+
+        weather_db.DB_PATH = os.path.join(work_dir, "history.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            weather_db.init_database()
+            weather_analytics.register()
+        print(f"合成履歴を作成中: {area_count}地域 × {days}日 × {RUNS_PER_DAY}回")
+        start = build_history(areas, days, datetime(2026, 1, 1), rng)
+        print(f"履歴DBのサイズ: {os.path.getsize(weather_db.DB_PATH):,} バイト")
+        results.update(bench_queries(areas, start, days, iterations, rng))
+    finally:
+        weather_db.close_all()
+        weather_db.DB_PATH = original_path
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_baseline(results, settings, path=BASELINE_PATH):
+    baseline = {
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "settings": settings,
+        "stages": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def report(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """結果を表で表示し、遅くなった処理の名前を返す"""
+    stages = (baseline or {}).get("stages", {})
+    regressions = []
+    print(f"{'処理':<14}{'回数':>5}{'回/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}  基準値比")
+    for name, result in results.items():
+        line = (
+            f"{name:<16}{result['count']:>7}{result['ops_per_sec']:>12,.0f}"
+            f"{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+        )
+        base = stages.get(name)
+        if base and base["p50_ms"] > 0:
+            ratio = result["p50_ms"] / base["p50_ms"] - 1
+            line += f"  {ratio:+.0%}"
+            if ratio > threshold:
+                line += "  ← 遅くなっています"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="天気予報の処理のベンチマーク")
+    parser.add_argument("--days", type=int, default=180, help="合成履歴の日数")
+    parser.add_argument("--areas", type=int, default=20, help="合成履歴の地域数")
+    parser.add_argument("--iterations", type=int, default=2000, help="各処理の測定回数")
+    parser.add_argument("--seed", type=int, default=0, help="合成データの乱数シード")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基準値のJSONファイル")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="遅くなったとみなす割合（0.25 = 25%%）")
+    parser.add_argument("--save-baseline", action="store_true", help="結果を基準値として保存")
+    parser.add_argument("--check", action="store_true", help="遅くなった処理があれば終了コード1")
+    args = parser.parse_args()
+
+    settings = {"days": args.days, "areas": args.areas, "iterations": args.iterations, "seed": args.seed}
+    mismatches = check_weather_icons(load_fixtures())
+    for code, date_str, weather_code, weather in mismatches:
+        print(f"天気コードと文言が一致しません: {code} {date_str} {weather_code} {weather}")
+    results = run_benchmarks(args.days, args.areas, args.iterations, args.seed)
+
+    baseline = load_baseline(args.baseline)
+    if baseline and baseline.get("settings") != settings:
+        print(f"注意: 基準値の測定条件が異なります（{baseline.get('settings')}）")
+    regressions = report(results, baseline, args.threshold)
+    if "parse_legacy" in results:
+        speedup = results["parse_legacy"]["p50_ms"] / results["parse"]["p50_ms"]
+        print(f"parse は jma_parser 以前の実装（parse_legacy）の {speedup:.2f} 倍の速さ")
+
+    if args.save_baseline:
+        save_baseline(results, settings, args.baseline)
+        print(f"基準値を保存: {args.baseline}")
+    elif (regressions or mismatches) and args.check:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""クリックから表示までの時間の測定（気象庁APIの代替サーバーを使う）
+
+jma_standin.py の代替サーバーを起動し、アプリと同じ ForecastLoader で地域を選んでから
+結果が届く（画面に表示できる）までの時間を、遅延やエラーの条件ごとに測る。
+
+使い方:
+    python benchmarks/e2e_latency.py                    # 全シナリオ
+    python benchmarks/e2e_latency.py --clicks 100 --scenario slow --scenario flaky
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import weather_analytics  # noqa: E402
+import weather_db  # noqa: E402
+from bench_weather import summarize  # noqa: E402
+from jma_client import JmaClient  # noqa: E402
+from jma_standin import FIXTURE_DIR, StandinConfig, StandinServer, StandinStats  # noqa: E402
+from weather_hub import WeatherHub  # noqa: E402
+from weather_service import ForecastLoader  # noqa: E402
+
+# 結果を待つ上限（秒）
+RESULT_TIMEOUT = 30
+
+
+@dataclass
+class Scenario:
+    """測定の条件
+
+    forecast_max_age は JmaClient のキャッシュの鮮度（0 なら毎回条件付きGET）。
+    burst はまとめてクリックする回数（最後に選んだ地域の表示までを測る）。
+    sessions が2以上なら、WeatherHub を共有するその数のセッションが同じ地域を同時に選び、
+    全セッションに結果が届くまでを測る（直近の予報は使わず、同時の取得をまとめる効果だけを見る）。
+    stale_after を指定するとアプリと同じくDBの保存分を先に表示し、最初の表示までを測る。
+    """
+    name: str
+    description: str
+    standin: dict = field(default_factory=dict)
+    forecast_max_age: int = 0
+    client_timeout: float = 10
+    burst: int = 1
+    sessions: int = 1
+    stale_after: int = None
+
+
+SCENARIOS = [
+    Scenario("fast", "遅延20ms・毎回条件付きGET（304）", {"latency": 0.02}),
+    Scenario("cached", "遅延20ms・キャッシュの鮮度内（通信なし）", {"latency": 0.02}, forecast_max_age=600),
+    Scenario("slow", "遅延300〜500ms", {"latency": 0.3, "jitter": 0.2}),
+    Scenario("flaky", "503が30%・空の本文が10%（DBにフォールバック）",
+             {"latency": 0.02, "error_rates": {"503": 0.3, "empty": 0.1}}),
+    Scenario("timeout", "20%がタイムアウト（クライアントは0.5秒で打ち切り）",
+             {"latency": 0.02, "error_rates": {"timeout": 0.2}, "hang": 2.0}, client_timeout=0.5),
+    Scenario("rapid", "遅延200msで5回続けてクリック（最後の地域だけ表示）",
+             {"latency": 0.2}, burst=5),
+    Scenario("sessions", "遅延200msで20セッションが同じ地域を同時に選ぶ（取得は1回にまとめる）",
+             {"latency": 0.2}, sessions=20),
+    Scenario("swr", "遅延300〜500ms・保存分を先に表示（裏で毎回取得）",
+             {"latency": 0.3, "jitter": 0.2}, stale_after=0),
+]
+
+
+def office_codes(fixture_dir=FIXTURE_DIR):
+    with open(os.path.join(fixture_dir, "area.json"), encoding="utf-8") as f:
+        offices = json.load(f)["offices"]
+    return [(code, info["name"]) for code, info in sorted(offices.items())]
+
+
+def click(loader, area_code, area_name, burst_areas=(), stale_after=None):
+    """地域を選んでから最初の結果が届くまでの秒数と、最後に届いた結果を返す
+
+    保存分を先に表示して裏で取得するときは、取得結果が届くまで待ってから返す。
+    """
+    done = threading.Event()
+    received = []
+    first = []
+
+    def on_done(result):
+        if not first:
+            first.append(time.perf_counter())
+        received.append(result)
+        if not result.refreshing:
+            done.set()
+
+    start = time.perf_counter()
+    for code, name in burst_areas:
+        loader.load(code, name, on_done, stale_after=stale_after)
+    loader.load(area_code, area_name, on_done, stale_after=stale_after)
+    if not done.wait(RESULT_TIMEOUT):
+        raise TimeoutError(f"{RESULT_TIMEOUT}秒以内に結果が届きませんでした: {area_name}")
+    return first[0] - start, received[-1]
+
+
+def click_sessions(loaders, area_code, area_name):
+    """全セッションで同じ地域を同時に選び、全員に結果が届くまでの秒数と最後の結果を返す"""
+    done = threading.Event()
+    received = []
+    lock = threading.Lock()
+
+    def on_done(result):
+        with lock:
+            received.append(result)
+            if len(received) == len(loaders):
+                done.set()
+
+    start = time.perf_counter()
+    for loader in loaders:
+        loader.load(area_code, area_name, on_done)
+    if not done.wait(RESULT_TIMEOUT):
+        raise TimeoutError(f"{RESULT_TIMEOUT}秒以内に全セッションに結果が届きませんでした: {area_name}")
+    return time.perf_counter() - start, received[-1]
+
+
+def run_scenario(scenario, offices, clicks, seed):
+    """シナリオを1つ実行して、測定結果の辞書を返す"""
+    rng = random.Random(seed)
+    work_dir = tempfile.mkdtemp(prefix="weather-e2e-")
+    original_path = weather_db.DB_PATH
+    timings = []
+    sources = {}
+    errors = 0
+    try:
+        weather_db.DB_PATH = os.path.join(work_dir, "weather.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            weather_db.init_database()
+            weather_analytics.register()
+
+        config = StandinConfig(seed=seed, **scenario.standin)
+        with StandinServer(config) as server:
+            # 事前に全地域を1回取得しておく（エラー時にDBへフォールバックできるように）
+            seed_client = JmaClient(cache_dir=os.path.join(work_dir, "seed_cache"), base_url=server.base_url)
+            error_rates, config.error_rates = config.error_rates, {}
+            seed_loader = ForecastLoader(seed_client)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for code, name in offices:
+                    click(seed_loader, code, name)
+            seed_loader.shutdown()
+            config.error_rates = error_rates
+
+            client = JmaClient(
+                cache_dir=os.path.join(work_dir, "cache"),
+                forecast_max_age=scenario.forecast_max_age,
+                timeout=scenario.client_timeout,
+                base_url=server.base_url,
+            )
+            if scenario.sessions > 1:
+                hub = WeatherHub(client, recent_ttl=0, max_workers=scenario.sessions)
+                loaders = [hub.loader() for _ in range(scenario.sessions)]
+                loader = loaders[0]
+            else:
+                hub = None
+                loader = ForecastLoader(client)
+            with contextlib.redirect_stdout(io.StringIO()):
+                # キャッシュありのシナリオ用に、先に1回ずつ取得してキャッシュを作る
+                for code, name in offices:
+                    click(loader, code, name)
+                server.stats = StandinStats()
+                for _ in range(clicks):
+                    if hub is not None:
+                        elapsed, result = click_sessions(loaders, *rng.choice(offices))
+                    else:
+                        burst = [rng.choice(offices) for _ in range(scenario.burst - 1)]
+                        elapsed, result = click(loader, *rng.choice(offices), burst, scenario.stale_after)
+                    timings.append(elapsed)
+                    sources[result.source] = sources.get(result.source, 0) + 1
+                    if result.error:
+                        errors += 1
+            loader.shutdown()
+            if hub is not None:
+                hub.shutdown()
+            server_stats = server.stats
+    finally:
+        weather_db.close_all()
+        weather_db.DB_PATH = original_path
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = summarize(timings)
+    result.update({
+        "sources": sources,
+        "errors": errors,
+        "server_requests": server_stats.requests,
+        "server_not_modified": server_stats.not_modified,
+        "server_errors": server_stats.errors,
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="クリックから表示までの時間を測定")
+    parser.add_argument("--clicks", type=int, default=50, help="シナリオごとのクリック数")
+    parser.add_argument("--scenario", action="append", choices=[s.name for s in SCENARIOS],
+                        help="実行するシナリオ（省略時はすべて）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果をJSONで保存するファイル")
+    args = parser.parse_args()
+
+    offices = office_codes()
+    selected = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    results = {}
+    print(f"{'シナリオ':<10}{'回数':>5}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}  取得元 / サーバー応答")
+    for scenario in selected:
+        result = run_scenario(scenario, offices, args.clicks, args.seed)
+        results[scenario.name] = result
+        print(
+            f"{scenario.name:<12}{result['count']:>5}{result['p50_ms']:>10.1f}"
+            f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}  "
+            f"{result['sources']} / 要求{result['server_requests']}件, "
+            f"304が{result['server_not_modified']}件, エラー{result['server_errors']}"
+        )
+        print(f"{'':<12}{scenario.description}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""気象庁APIのクライアント（ディスクキャッシュ付き）
+
+URLごとに ETag / Last-Modified とレスポンス本文を保存し、
+次回は条件付きリクエストを送って 304 ならキャッシュの本文を使う。
+鮮度の期間内ならリクエスト自体を送らない。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 気象庁APIのURL。環境変数 JMA_BASE_URL でローカルの代替サーバー（jma_standin.py）などに向けられる
+BASE_URL = "https://www.jma.go.jp/bosai"
+AREA_PATH = "/common/const/area.json"
+FORECAST_PATH = "/forecast/data/forecast/{area_code}.json"
+
+AREA_URL = BASE_URL + AREA_PATH
+FORECAST_URL = BASE_URL + FORECAST_PATH
+
+# キャッシュの保存先
+CACHE_DIR = "jma_cache"
+
+# 鮮度の期間（秒）。この間は気象庁に問い合わせずにキャッシュを返す
+AREA_MAX_AGE = 24 * 60 * 60
+FORECAST_MAX_AGE = 10 * 60
+
+
+class CachedResponse:
+    """requests.Response と同じように使えるレスポンス"""
+
+    def __init__(self, url, status_code, content, headers=None, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        """本文をJSONとして解析（失敗時は requests と同じ例外を投げる）"""
+        try:
+            return json.loads(self.text)
+        except json.JSONDecodeError as e:
+            raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos)
+
+
+class JmaClient:
+    """条件付きGETとディスクキャッシュを使う気象庁APIクライアント"""
+
+    def __init__(self, cache_dir=CACHE_DIR, area_max_age=AREA_MAX_AGE,
+                 forecast_max_age=FORECAST_MAX_AGE, timeout=10, session=None, pool_size=10,
+                 base_url=None):
+        self.base_url = (base_url or os.environ.get("JMA_BASE_URL") or BASE_URL).rstrip("/")
+        self.cache_dir = cache_dir
+        self.area_max_age = area_max_age
+        self.forecast_max_age = forecast_max_age
+        self.timeout = timeout
+        if session is None:
+            # 並列に取得するときもTCP/TLS接続を使い回せるよう、接続プールを大きめにする
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + ".json", base + ".body"
+
+    def _load_entry(self, url):
+        """キャッシュ（メタ情報, 本文）を読む。なければ (None, None)"""
+        meta_path, body_path = self._cache_paths(url)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if meta.get("url") != url:
+            return None, None
+        return meta, body
+
+    def _write_atomic(self, path, data):
+        # 別スレッドが読んでも壊れたファイルが見えないよう、一時ファイルから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _store_entry(self, url, meta, body=None):
+        meta_path, body_path = self._cache_paths(url)
+        if body is not None:
+            self._write_atomic(body_path, body)
+        self._write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def get_cached(self, url):
+        """通信せずにキャッシュだけを返す（古くても返す。なければ None）"""
+        meta, body = self._load_entry(url)
+        if meta is None:
+            return None
+        return CachedResponse(url, 200, body, meta.get("headers"), from_cache=True)
+
+    def get(self, url, max_age=0, timeout=None):
+        """URLを取得（キャッシュが新しければ通信しない、古ければ条件付きGET）"""
+        meta, body = self._load_entry(url)
+        now = time.time()
+
+        if meta is not None and now - meta["stored_at"] < max_age:
+            return CachedResponse(url, 200, body, meta.get("headers"), from_cache=True)
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=timeout or self.timeout)
+
+        if response.status_code == 304 and meta is not None:
+            # 変更なし：本文はキャッシュを使い、鮮度だけ更新する
+            meta["stored_at"] = now
+            self._store_entry(url, meta)
+            return CachedResponse(url, 200, body, meta.get("headers"), from_cache=True)
+
+        if response.status_code == 200 and response.content:
+            self._store_entry(url, {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "headers": {"Content-Type": response.headers.get("Content-Type", "")},
+                "stored_at": now,
+            }, response.content)
+
+        return CachedResponse(url, response.status_code, response.content, dict(response.headers))
+
+    def get_area_json(self):
+        """地域一覧（area.json）を取得"""
+        return self.get(self.base_url + AREA_PATH, max_age=self.area_max_age)
+
+    def get_cached_area_json(self):
+        """前回保存した area.json（オフライン起動用）"""
+        return self.get_cached(self.base_url + AREA_PATH)
+
+    def get_forecast(self, area_code):
+        """地域の天気予報を取得"""
+        url = self.base_url + FORECAST_PATH.format(area_code=area_code)
+        return self.get(url, max_age=self.forecast_max_age)
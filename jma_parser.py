@@ -0,0 +1,316 @@
+"""気象庁の予報JSON（forecast/{office}.json）の解析
+
+レスポンスを1回だけ走査し、全地域・全項目を型付きのレコードとして取り出す。
+
+レスポンスは [短期予報, 週間予報] のリストで、それぞれの timeSeries の先頭が
+一次細分区域（class10、例: 東京地方）ごとの天気、後ろの timeSeries が
+気温の観測地点（例: 東京）ごとの値になっている。観測地点は同じ予報内の
+先頭の timeSeries と同じ順番で並んでいるので、位置で class10 に対応付ける。
+"""
+from collections import namedtuple
+
+# 予報の1つの値
+#   report: 0 = 短期予報, 1 = 週間予報
+#   area_code/area_name: 値が属する地域（気温なら観測地点）
+#   region_code: 対応する一次細分区域（class10）のコード
+#   time: timeDefines の時刻（平年値などは None）
+ForecastRecord = namedtuple(
+    "ForecastRecord", "report area_code area_name region_code time field value"
+)
+
+# JSONのキー -> (項目名, 型)
+FIELDS = {
+    "weatherCodes": ("weather_code", int),
+    "weathers": ("weather", str),
+    "winds": ("wind", str),
+    "waves": ("wave", str),
+    "pops": ("pop", int),
+    "reliabilities": ("reliability", str),
+    "temps": ("temp", int),
+    "tempsMin": ("temp_min", int),
+    "tempsMinUpper": ("temp_min_upper", int),
+    "tempsMinLower": ("temp_min_lower", int),
+    "tempsMax": ("temp_max", int),
+    "tempsMaxUpper": ("temp_max_upper", int),
+    "tempsMaxLower": ("temp_max_lower", int),
+}
+
+# 週間予報の平年値（時刻なし）: JSONのキー -> 項目名の接頭辞
+AVERAGE_FIELDS = {
+    "tempAverage": "temp_avg",
+    "precipAverage": "precip_avg",
+}
+
+ALL_FIELDS = frozenset(
+    [name for name, _ in FIELDS.values()]
+    + [f"{prefix}_{bound}" for prefix in AVERAGE_FIELDS.values() for bound in ("min", "max")]
+)
+
+
+def _convert(convert, value):
+    """文字列の値を型変換（空文字や変換できない値は None）"""
+    if value is None or value == "":
+        return None
+    try:
+        return convert(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def iter_records(forecast_data, fields=None):
+    """予報JSONから ForecastRecord を順に取り出す
+
+    fields に項目名の集合を渡すと、その項目だけを取り出す（None なら全項目）。
+    空の値は取り出さない。週間予報の地域は summarize_daily と同じく _region_targets で
+    短期予報の class10 に対応付け、府県単位の1地域が複数の class10 にあたるときは
+    class10 ごとにレコードを出す。
+    """
+    known = []
+    for report_index, report in enumerate(forecast_data or []):
+        targets = []
+        for series_index, ts in enumerate(report.get("timeSeries", [])):
+            times = ts.get("timeDefines", [])
+            areas = ts.get("areas", [])
+            if series_index == 0:
+                targets = _region_targets(areas, known)
+                if not known:
+                    known = [codes[0] for codes in targets]
+            for position, area in enumerate(areas):
+                info = area.get("area", {})
+                code = info.get("code")
+                name = info.get("name")
+                regions = targets[position] if position < len(targets) else [code]
+
+                for key, values in area.items():
+                    if key == "area":
+                        continue
+                    field, convert = FIELDS.get(key, (key, str))
+                    if fields is not None and field not in fields:
+                        continue
+                    for time, raw in zip(times, values):
+                        value = _convert(convert, raw)
+                        if value is not None:
+                            for region in regions:
+                                yield ForecastRecord(report_index, code, name, region, time, field, value)
+
+        for key, prefix in AVERAGE_FIELDS.items():
+            averages = report.get(key, {}).get("areas", [])
+            for position, area in enumerate(averages):
+                info = area.get("area", {})
+                code = info.get("code")
+                regions = targets[position] if position < len(targets) else [code]
+                for bound in ("min", "max"):
+                    field = f"{prefix}_{bound}"
+                    if fields is not None and field not in fields:
+                        continue
+                    value = _convert(float, area.get(bound))
+                    if value is not None:
+                        for region in regions:
+                            yield ForecastRecord(report_index, code, info.get("name"), region, None, field, value)
+
+
+def parse_forecast(forecast_data, fields=None):
+    """iter_records() の結果をリストで返す"""
+    return list(iter_records(forecast_data, fields))
+
+
+def _region_targets(areas, known):
+    """予報の先頭の timeSeries の地域ごとに、値を書き込む class10 コードのリスト
+
+    known は先に読んだ予報（短期予報）の class10 コード。週間予報の地域コードは
+    府県単位（例: 短期予報の 140010 に対して 140000）のことがあるので、短期予報にない
+    コードなら、週間予報の地域が1つのときはすべての class10 に、複数のときは同じ位置の
+    class10 に書き込む。
+    """
+    codes = [area.get("area", {}).get("code") for area in areas]
+    if not known:
+        return [[code] for code in codes]
+    targets = []
+    for position, code in enumerate(codes):
+        if code in known:
+            targets.append([code])
+        elif len(codes) == 1:
+            targets.append(list(known))
+        elif position < len(known):
+            targets.append([known[position]])
+        else:
+            targets.append([code])
+    return targets
+
+
+def summarize_daily(forecast_data, first_only=False):
+    """一次細分区域（class10）ごとに日別の天気・最低/最高気温をまとめる
+
+    戻り値は class10 コード -> {"name": 地域名, "days": {日付: {weather, weather_code,
+    temp_min, temp_max}}}（レスポンスに出てきた順）。
+    短期予報の気温（temps）はその日の最小・最大を取り、週間予報の tempsMin/tempsMax が
+    あればそちらで上書きする。週間予報の地域は _region_targets で短期予報の class10 に対応付ける。
+    first_only=True なら先頭の地域だけをまとめる（_summarize_first で他の地域を読まない）。
+    """
+    if first_only:
+        return _summarize_first(forecast_data)
+    result = {}
+    known = []
+    for report in forecast_data or []:
+        targets = []
+        for series_index, ts in enumerate(report.get("timeSeries", [])):
+            dates = [time[:10] for time in ts.get("timeDefines", [])]
+            areas = ts.get("areas", [])
+            if series_index == 0:
+                targets = _region_targets(areas, known)
+                if not known:
+                    known = [codes[0] for codes in targets]
+                for area, codes in zip(areas, targets):
+                    for code in codes:
+                        result.setdefault(code, {"name": area.get("area", {}).get("name"), "days": {}})
+            for position, area in enumerate(areas):
+                if position >= len(targets):
+                    continue
+                for code in targets[position]:
+                    if code in result:
+                        _merge_days(result[code]["days"], dates, area)
+    return result
+
+
+def _summarize_first(forecast_data):
+    """summarize_daily(first_only=True) の本体
+
+    先頭の地域の値だけを読み、日別の辞書に直接書き込む（予報の表示のたびに呼ばれるので、
+    他の地域の対応付けや _merge_days・_convert の呼び出しを省く）。結果は summarize_daily と同じ。
+    """
+    days = {}
+    first = None
+    name = None
+
+    def day(date_str):
+        entry = days.get(date_str)
+        if entry is None:
+            entry = days[date_str] = {
+                "weather": None, "weather_code": None, "temp_min": None, "temp_max": None,
+            }
+        return entry
+
+    for report in forecast_data or []:
+        position = None
+        for series_index, ts in enumerate(report.get("timeSeries", [])):
+            areas = ts.get("areas", [])
+            if series_index == 0:
+                if not areas:
+                    break
+                if first is None:
+                    info = areas[0].get("area", {})
+                    first, name, position = info.get("code"), info.get("name"), 0
+                else:
+                    # _region_targets で先頭の class10 に対応する地域（同じコードがなければ先頭）
+                    codes = [area.get("area", {}).get("code") for area in areas]
+                    position = codes.index(first) if first in codes else 0
+            if position is None or position >= len(areas):
+                continue
+            area = areas[position]
+            weathers = area.get("weathers", ())
+            weather_codes = area.get("weatherCodes", ())
+            temps = area.get("temps", ())
+            temps_min = area.get("tempsMin", ())
+            temps_max = area.get("tempsMax", ())
+            if not (weathers or weather_codes or temps or temps_min or temps_max):
+                continue
+            dates = [time[:10] for time in ts.get("timeDefines", [])]
+
+            # 天気（_merge_days と同じく、アイコンと文言は同じ予報から取る）
+            if weathers or weather_codes:
+                for i, date_str in enumerate(dates):
+                    entry = day(date_str)
+                    if i < len(weathers):
+                        entry["weather"] = weathers[i]
+                    elif entry["weather"] is not None or entry["weather_code"] is not None:
+                        continue
+                    if i < len(weather_codes):
+                        try:
+                            entry["weather_code"] = int(weather_codes[i])
+                        except (ValueError, TypeError):
+                            pass
+
+            for date_str, raw in zip(dates, temps):
+                try:
+                    value = int(raw)
+                except (ValueError, TypeError):
+                    continue
+                entry = day(date_str)
+                if entry["temp_min"] is None or value < entry["temp_min"]:
+                    entry["temp_min"] = value
+                if entry["temp_max"] is None or value > entry["temp_max"]:
+                    entry["temp_max"] = value
+
+            if temps_min or temps_max:
+                for i, date_str in enumerate(dates):
+                    entry = day(date_str)
+                    if i < len(temps_min):
+                        try:
+                            entry["temp_min"] = int(temps_min[i])
+                        except (ValueError, TypeError):
+                            pass
+                    if i < len(temps_max):
+                        try:
+                            entry["temp_max"] = int(temps_max[i])
+                        except (ValueError, TypeError):
+                            pass
+
+    if first is None:
+        return {}
+    return {first: {"name": name, "days": days}}
+
+
+def _merge_days(days, dates, area):
+    """1つの地域の値を日別の辞書に書き込む"""
+
+    def day(date_str):
+        entry = days.get(date_str)
+        if entry is None:
+            entry = days[date_str] = {
+                "weather": None, "weather_code": None, "temp_min": None, "temp_max": None,
+            }
+        return entry
+
+    # 天気（週間予報は天気コードのみ）
+    # アイコン（天気コード）と文言は同じ予報から取る。短期予報の天気がある日は、
+    # 週間予報の天気コードで上書きしない
+    weathers = area.get("weathers", [])
+    weather_codes = area.get("weatherCodes", [])
+    if weathers or weather_codes:
+        for i, date_str in enumerate(dates):
+            entry = day(date_str)
+            if i < len(weathers):
+                entry["weather"] = weathers[i]
+            elif entry["weather"] is not None or entry["weather_code"] is not None:
+                continue
+            if i < len(weather_codes):
+                code = _convert(int, weather_codes[i])
+                if code is not None:
+                    entry["weather_code"] = code
+
+    # 気温（短期予報は時刻ごとの値からその日の最低・最高を取る）
+    temps = area.get("temps", [])
+    for date_str, raw in zip(dates, temps):
+        value = _convert(int, raw)
+        if value is None:
+            continue
+        entry = day(date_str)
+        if entry["temp_min"] is None or value < entry["temp_min"]:
+            entry["temp_min"] = value
+        if entry["temp_max"] is None or value > entry["temp_max"]:
+            entry["temp_max"] = value
+
+    # 最低・最高気温（週間予報）
+    temps_min = area.get("tempsMin", [])
+    temps_max = area.get("tempsMax", [])
+    if temps_min or temps_max:
+        for i, date_str in enumerate(dates):
+            entry = day(date_str)
+            if i < len(temps_min):
+                value = _convert(int, temps_min[i])
+                if value is not None:
+                    entry["temp_min"] = value
+            if i < len(temps_max):
+                value = _convert(int, temps_max[i])
+                if value is not None:
+                    entry["temp_max"] = value
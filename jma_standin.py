@@ -0,0 +1,262 @@
+"""気象庁APIのローカル代替サーバー
+
+保存しておいた area.json と予報のJSONを気象庁と同じパスで返す。
+応答の遅延・エラー（404, 503, 空の本文, タイムアウト）・本文の大きさを設定でき、
+遅い・失敗する気象庁を再現して、キャッシュや並列取得、DBへのフォールバックを確かめられる。
+
+使い方:
+    python jma_standin.py                                  # http://127.0.0.1:8765 で起動
+    python jma_standin.py --latency 0.3 --jitter 0.2       # 0.3〜0.5秒遅らせる
+    python jma_standin.py --error-rate 503=0.2 --error-rate timeout=0.05
+    JMA_BASE_URL=http://127.0.0.1:8765 python lecture-6-weather-app.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from jma_client import AREA_PATH
+
+# 既定で返すJSON（benchmarks/fixtures/ の area.json と forecast_<コード>.json）
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "fixtures")
+
+DEFAULT_PORT = 8765
+
+# 再現できるエラーの種類
+ERROR_KINDS = ("404", "503", "empty", "timeout")
+
+_FORECAST_PATH = re.compile(r"^/forecast/data/forecast/(\d{6})\.json$")
+
+
+@dataclass
+class StandinConfig:
+    """代替サーバーの設定
+
+    latency + 0〜jitter 秒遅らせて応答する。error_rates は種類 -> 確率。
+    timeout のエラーは hang 秒待ってから応答する（クライアントのタイムアウトより長くする）。
+    pad_bytes だけ本文の末尾に空白を足す（大きな応答の再現用、JSONとしては同じ内容）。
+    any_office が True なら、フィクスチャのない地域にも別の地域の予報を返す。
+    """
+    fixture_dir: str = FIXTURE_DIR
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rates: dict = field(default_factory=dict)
+    hang: float = 30.0
+    pad_bytes: int = 0
+    any_office: bool = True
+    seed: int = None
+
+
+@dataclass
+class StandinStats:
+    """代替サーバーが返した応答の数"""
+    requests: int = 0
+    not_modified: int = 0
+    errors: dict = field(default_factory=dict)
+
+
+def _load_fixtures(fixture_dir):
+    """パス -> 本文（バイト列）。予報はコード順のリストも返す"""
+    bodies = {}
+    forecasts = []
+    for name in sorted(os.listdir(fixture_dir)):
+        path = os.path.join(fixture_dir, name)
+        if name == "area.json":
+            with open(path, "rb") as f:
+                bodies[AREA_PATH] = f.read()
+        elif name.startswith("forecast_") and name.endswith(".json"):
+            with open(path, "rb") as f:
+                body = f.read()
+            forecasts.append(body)
+            bodies[f"/forecast/data/forecast/{name[len('forecast_'):]}"] = body
+    return bodies, forecasts
+
+
+class StandinServer:
+    """別スレッドで動く代替サーバー（with 文でも使える）"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or StandinConfig()
+        self.stats = StandinStats()
+        self._bodies, self._forecasts = _load_fixtures(self.config.fixture_dir)
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="jma-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def _body_for(self, path):
+        body = self._bodies.get(path)
+        if body is None and self.config.any_office and self._forecasts:
+            match = _FORECAST_PATH.match(path)
+            if match:
+                # 同じ地域コードにはいつも同じ予報を返す
+                body = self._forecasts[int(match.group(1)) % len(self._forecasts)]
+        if body is not None and self.config.pad_bytes:
+            body = body + b" " * self.config.pad_bytes
+        return body
+
+    def _pick(self):
+        """(遅延秒数, エラーの種類 or None) を決める"""
+        with self._lock:
+            delay = self.config.latency + self._random.uniform(0, self.config.jitter)
+            roll = self._random.random()
+        for kind in ERROR_KINDS:
+            rate = self.config.error_rates.get(kind, 0.0)
+            if roll < rate:
+                return delay, kind
+            roll -= rate
+        return delay, None
+
+    def _count(self, error=None, not_modified=False):
+        with self._lock:
+            self.stats.requests += 1
+            if not_modified:
+                self.stats.not_modified += 1
+            if error:
+                self.stats.errors[error] = self.stats.errors.get(error, 0) + 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                delay, error = server._pick()
+                if delay:
+                    time.sleep(delay)
+                body = server._body_for(self.path.split("?")[0])
+                if body is None:
+                    error = "404"
+
+                if error == "timeout":
+                    server._count(error)
+                    time.sleep(server.config.hang)
+                    self._send(503, b"")
+                elif error == "404":
+                    server._count(error)
+                    self._send(404, b"Not Found")
+                elif error == "503":
+                    server._count(error)
+                    self._send(503, b"Service Unavailable")
+                elif error == "empty":
+                    server._count(error)
+                    self._send(200, b"")
+                else:
+                    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        server._count(not_modified=True)
+                        self._send(304, b"", etag)
+                    else:
+                        server._count()
+                        self._send(200, body, etag)
+
+            def _send(self, status, body, etag=None):
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.send_header("Last-Modified", formatdate(usegmt=True))
+                    if etag:
+                        self.send_header("ETag", etag)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # クライアントがタイムアウトで先に切断した
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def parse_error_rates(values):
+    """["503=0.2", "timeout=0.05"] -> {"503": 0.2, "timeout": 0.05}"""
+    rates = {}
+    for value in values or []:
+        kind, _, rate = value.partition("=")
+        if kind not in ERROR_KINDS:
+            raise ValueError(f"エラーの種類は {', '.join(ERROR_KINDS)} のどれか: {kind}")
+        rates[kind] = float(rate)
+    if sum(rates.values()) > 1:
+        raise ValueError("エラーの確率の合計は1以下にしてください")
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="気象庁APIのローカル代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--fixtures", default=FIXTURE_DIR, help="area.json と forecast_*.json のディレクトリ")
+    parser.add_argument("--latency", type=float, default=0.0, help="応答の遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅延に加えるばらつき（秒）")
+    parser.add_argument("--error-rate", action="append", metavar="種類=確率",
+                        help=f"エラーを返す確率（種類: {', '.join(ERROR_KINDS)}）")
+    parser.add_argument("--hang", type=float, default=30.0, help="timeout のときに待つ秒数")
+    parser.add_argument("--pad-bytes", type=int, default=0, help="本文に足す空白のバイト数")
+    parser.add_argument("--fixtures-only", action="store_true",
+                        help="フィクスチャのない地域は404にする")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        error_rates = parse_error_rates(args.error_rate)
+    except ValueError as e:
+        parser.error(str(e))
+
+    config = StandinConfig(
+        fixture_dir=args.fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rates=error_rates,
+        hang=args.hang,
+        pad_bytes=args.pad_bytes,
+        any_office=not args.fixtures_only,
+        seed=args.seed,
+    )
+    server = StandinServer(config, args.host, args.port)
+    print(f"気象庁APIの代替サーバーを起動: {server.base_url}")
+    print(json.dumps(config.__dict__, ensure_ascii=False))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"応答: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 import flet as ft
-import requests
+
+from jma_client import JmaClient
+from weather_codes import classify, short_text
+from weather_service import parse_forecast_data
 
 
 def main(page: ft.Page):
@@ -7,10 +10,12 @@ def main(page: ft.Page):
     page.theme_mode = ft.ThemeMode.LIGHT
     page.padding = 0
 
+    # 気象庁APIクライアント（ETag/Last-Modified付きのディスクキャッシュ）
+    client = JmaClient()
+
     # 気象庁APIから地域データを取得
-    area_url = "http://www.jma.go.jp/bosai/common/const/area.json"
     try:
-        area_data = requests.get(area_url).json()
+        area_data = client.get_area_json().json()
     except Exception as e:
         page.add(ft.Text(f"地域データの取得に失敗しました: {e}"))
         return
@@ -25,35 +30,11 @@ def main(page: ft.Page):
         expand=True,
     )
 
-    # 天気アイコンのマッピング（気象庁のtelop codeに対応）
-    def get_weather_icon(weather_text):
-        if "雨" in weather_text and "晴" in weather_text:
-            return "☀️🌧️"
-        elif "雨" in weather_text and "曇" in weather_text:
-            return "☁️🌧️"
-        elif "雪" in weather_text:
-            return "❄️"
-        elif "雨" in weather_text:
-            return "🌧️"
-        elif "曇" in weather_text and "晴" in weather_text:
-            return "⛅"
-        elif "晴" in weather_text and "曇" in weather_text:
-            return "🌤️"
-        elif "曇" in weather_text:
-            return "☁️"
-        elif "晴" in weather_text:
-            return "☀️"
-        else:
-            return "🌈"
-
-    def create_weather_card(date, weather, temp_min, temp_max):
-        """天気予報カードを作成"""
-        icon = get_weather_icon(weather)
-        
-        # 天気テキストを短縮（改行を削除し、長い場合は省略）
-        weather_short = weather.replace("\n", " ").replace("　", " ")
-        if len(weather_short) > 20:
-            weather_short = weather_short[:18] + "..."
+    def create_weather_card(date, weather_code, weather, temp_min, temp_max):
+        """天気予報カードを作成（アイコンは天気コードから引く）"""
+        kind = classify(weather_code, weather)
+        icon = kind.icon
+        weather_short = short_text(weather) if weather else kind.label
         
         return ft.Container(
             content=ft.Column(
@@ -73,13 +54,13 @@ def main(page: ft.Page):
                     ft.Row(
                         controls=[
                             ft.Text(
-                                f"{temp_min}°C" if temp_min else "-",
+                                f"{temp_min}°C" if temp_min is not None else "-",
                                 color=ft.Colors.BLUE,
                                 size=12,
                             ),
                             ft.Text("/", size=12),
                             ft.Text(
-                                f"{temp_max}°C" if temp_max else "-",
+                                f"{temp_max}°C" if temp_max is not None else "-",
                                 color=ft.Colors.RED,
                                 size=12,
                             ),
@@ -104,10 +85,8 @@ def main(page: ft.Page):
 
     def fetch_weather(area_code, area_name):
         """地域の天気予報を取得して表示"""
-        forecast_url = f"https://www.jma.go.jp/bosai/forecast/data/forecast/{area_code}.json"
-        
         try:
-            forecast_data = requests.get(forecast_url).json()
+            forecast_data = client.get_forecast(area_code).json()
         except Exception as e:
             weather_content.controls = [
                 ft.Container(
@@ -118,78 +97,18 @@ def main(page: ft.Page):
             page.update()
             return
 
-        weather_dict = {}  # 日付をキーにしてデータを集約
-        
-        # 天気予報データを解析
-        if forecast_data and len(forecast_data) > 0:
-            for forecast_item in forecast_data:
-                time_series = forecast_item.get("timeSeries", [])
-                
-                for ts in time_series:
-                    time_defines = ts.get("timeDefines", [])
-                    areas = ts.get("areas", [])
-                    
-                    if not areas:
-                        continue
-                    
-                    area = areas[0]
-                    
-                    # 天気情報の取得
-                    weathers = area.get("weathers", [])
-                    if weathers:
-                        for i, time_def in enumerate(time_defines):
-                            date_str = time_def[:10]
-                            if date_str not in weather_dict:
-                                weather_dict[date_str] = {"weather": None, "temp_min": None, "temp_max": None}
-                            if i < len(weathers):
-                                weather_dict[date_str]["weather"] = weathers[i]
-                    
-                    # 気温情報の取得（temps配列 - 短期予報用）
-                    temps = area.get("temps", [])
-                    if temps and len(time_defines) > 0:
-                        # 短期予報のtempsは時刻ごとの気温
-                        # timeDefinesと対応させて、日付ごとに最低・最高を判定
-                        for i, time_def in enumerate(time_defines):
-                            if i >= len(temps) or not temps[i]:
-                                continue
-                            date_str = time_def[:10]
-                            if date_str not in weather_dict:
-                                weather_dict[date_str] = {"weather": None, "temp_min": None, "temp_max": None}
-                            
-                            temp_val = int(temps[i]) if temps[i] else None
-                            if temp_val is not None:
-                                current_min = weather_dict[date_str]["temp_min"]
-                                current_max = weather_dict[date_str]["temp_max"]
-                                
-                                # 最低気温の更新
-                                if current_min is None or temp_val < int(current_min):
-                                    weather_dict[date_str]["temp_min"] = temps[i]
-                                # 最高気温の更新
-                                if current_max is None or temp_val > int(current_max):
-                                    weather_dict[date_str]["temp_max"] = temps[i]
-                    
-                    # tempsMin/tempsMax（週間予報用）
-                    temps_min = area.get("tempsMin", [])
-                    temps_max = area.get("tempsMax", [])
-                    
-                    if temps_min or temps_max:
-                        for i, time_def in enumerate(time_defines):
-                            date_str = time_def[:10]
-                            if date_str not in weather_dict:
-                                weather_dict[date_str] = {"weather": None, "temp_min": None, "temp_max": None}
-                            if temps_min and i < len(temps_min) and temps_min[i]:
-                                weather_dict[date_str]["temp_min"] = temps_min[i]
-                            if temps_max and i < len(temps_max) and temps_max[i]:
-                                weather_dict[date_str]["temp_max"] = temps_max[i]
+        # 天気予報データを解析（日付 -> 天気・天気コード・最低/最高気温）
+        weather_dict = parse_forecast_data(forecast_data)
 
         # カードを作成
         weather_cards = []
         for date_str in sorted(weather_dict.keys())[:7]:
             data = weather_dict[date_str]
-            if data["weather"]:
+            if data["weather"] or data["weather_code"] is not None:
                 weather_cards.append(
                     create_weather_card(
                         date_str,
+                        data["weather_code"],
                         data["weather"],
                         data["temp_min"],
                         data["temp_max"]
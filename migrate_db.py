@@ -0,0 +1,74 @@
+"""weather.db のスキーマを最新版に更新するツール
+
+使い方:
+    python migrate_db.py                 # weather.db を更新
+    python migrate_db.py --db other.db   # 別のDBファイルを更新
+    python migrate_db.py --no-backup     # バックアップを作らない
+"""
+import argparse
+import os
+import sqlite3
+
+import weather_db
+
+
+def backup_database(db_path):
+    """SQLiteのバックアップAPIでコピーを作成"""
+    backup_path = db_path + ".bak"
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(backup_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    return backup_path
+
+
+def file_size(db_path):
+    """DB本体とWALファイルの合計サイズ"""
+    return sum(
+        os.path.getsize(path)
+        for path in (db_path, db_path + "-wal")
+        if os.path.exists(path)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="weather.db のスキーマを更新")
+    parser.add_argument("--db", default=weather_db.DB_PATH, help="DBファイルのパス")
+    parser.add_argument("--no-backup", action="store_true", help="更新前のバックアップを作らない")
+    parser.add_argument("--no-vacuum", action="store_true", help="更新後のVACUUMを行わない")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"DBファイルが見つかりません: {args.db}")
+
+    conn = weather_db.get_connection(args.db)
+    before_version = weather_db.get_schema_version(conn)
+    before_size = file_size(args.db)
+    latest = len(weather_db.MIGRATIONS)
+    print(f"現在のスキーマ: v{before_version}（最新: v{latest}）")
+
+    if before_version >= latest:
+        print("更新は不要です")
+        return
+
+    if not args.no_backup:
+        print(f"バックアップを作成: {backup_database(args.db)}")
+
+    weather_db.migrate(args.db)
+
+    if not args.no_vacuum:
+        # 変換で空いたページを解放してファイルを縮める
+        conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    after_size = file_size(args.db)
+    print(f"スキーマを v{before_version} → v{weather_db.get_schema_version(conn)} に更新")
+    print(f"ファイルサイズ: {before_size:,} → {after_size:,} バイト")
+    weather_db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""予報履歴の集計表
+
+forecasts は取得ごとの履歴で、そのままでは傾向を見るたびに全件を読むことになる。
+予報を保存するたびに（weather_db.save_content と同じトランザクションで）前回の取得と比べて
+次の集計表に足し込んでおき、画面やグラフはこの表だけを読む。
+
+- forecast_day_stats: 地域・予報対象日ごとの予報回数、最低・最高気温の予報の幅、天気が変わった回数
+- forecast_revisions: 地域・何日先の予報か（lead_days）ごとの、前回の取得からの予報の変化
+
+保存フックは register() で登録する（予報を保存するコマンドとアプリの共有層が
+weather_db.init_database() の後に呼ぶ）。
+登録していないプロセス（古い版など）が保存した取得は、次に保存したときか
+catch_up() で集計する。過去の取得を書き直したときはその地域の集計を作り直す。
+保持ポリシーで削除・アーカイブした取得の分も集計には残る（rebuild() すると残っている取得だけになる）。
+
+使い方:
+    python weather_analytics.py                      # 未集計の取得を集計して全地域の概要を表示
+    python weather_analytics.py --area 130000        # 地域の予報対象日ごとの集計
+    python weather_analytics.py --rebuild            # 集計表を作り直す
+    python weather_analytics.py --db other.db        # 別のDBファイルを集計
+"""
+import argparse
+from collections import namedtuple
+from datetime import date
+
+import weather_db
+
+# 予報対象日ごとの集計（気温は予報された値の最小・最大）
+DayStats = namedtuple(
+    "DayStats",
+    "forecast_date fetches weather_changes temp_min_low temp_min_high "
+    "temp_max_low temp_max_high first_fetched_at last_fetched_at",
+)
+
+# 何日先の予報かごとの、前回の取得からの変化（平均は変化量の絶対値の平均）
+RevisionStats = namedtuple(
+    "RevisionStats",
+    "lead_days comparisons weather_change_rate temp_min_mean_move temp_max_mean_move max_abs_move",
+)
+
+
+def _weather_changed(old, new):
+    """天気が変わったか（天気コードがあればコードで、なければ文字列で比べる）"""
+    if old[0] is not None and new[0] is not None:
+        return old[0] != new[0]
+    return old[1] != new[1]
+
+
+def _lead_days(forecast_date, fetched_at):
+    try:
+        return (date.fromisoformat(forecast_date) - date.fromisoformat(fetched_at[:10])).days
+    except ValueError:
+        return None
+
+
+def _apply(conn, area_code, fetched_at, snapshot_id, content, previous):
+    """1回の取得を集計表に足し込む（previous は同じ地域の直前の取得の内容）"""
+    day_rows = []
+    revisions = {}
+    for date_str, day in content.items():
+        old = previous.get(date_str)
+        changed = old is not None and _weather_changed(old, day)
+        day_rows.append((
+            area_code, date_str, int(changed),
+            day[2], day[2], day[3], day[3], fetched_at, fetched_at,
+        ))
+        if old is None:
+            continue
+        lead = _lead_days(date_str, fetched_at)
+        if lead is None:
+            continue
+        stats = revisions.setdefault(lead, [0, 0, 0, 0.0, 0, 0.0, None])
+        stats[0] += 1
+        stats[1] += int(changed)
+        for i, count_index in ((2, 2), (3, 4)):
+            if old[i] is not None and day[i] is not None:
+                move = abs(day[i] - old[i])
+                stats[count_index] += 1
+                stats[count_index + 1] += move
+                stats[6] = move if stats[6] is None else max(stats[6], move)
+
+    # NULL の気温は既存の値を変えない（MIN/MAX は引数に NULL があると NULL になるので COALESCE で埋める）
+    conn.executemany("""
+        INSERT INTO forecast_day_stats (
+            area_code, forecast_date, fetches, weather_changes,
+            temp_min_low, temp_min_high, temp_max_low, temp_max_high,
+            first_fetched_at, last_fetched_at
+        ) VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(area_code, forecast_date) DO UPDATE SET
+            fetches = fetches + 1,
+            weather_changes = weather_changes + excluded.weather_changes,
+            temp_min_low = MIN(COALESCE(temp_min_low, excluded.temp_min_low),
+                               COALESCE(excluded.temp_min_low, temp_min_low)),
+            temp_min_high = MAX(COALESCE(temp_min_high, excluded.temp_min_high),
+                                COALESCE(excluded.temp_min_high, temp_min_high)),
+            temp_max_low = MIN(COALESCE(temp_max_low, excluded.temp_max_low),
+                               COALESCE(excluded.temp_max_low, temp_max_low)),
+            temp_max_high = MAX(COALESCE(temp_max_high, excluded.temp_max_high),
+                                COALESCE(excluded.temp_max_high, temp_max_high)),
+            first_fetched_at = MIN(first_fetched_at, excluded.first_fetched_at),
+            last_fetched_at = MAX(last_fetched_at, excluded.last_fetched_at)
+    """, day_rows)
+    conn.executemany("""
+        INSERT INTO forecast_revisions (
+            area_code, lead_days, comparisons, weather_changes,
+            temp_min_count, temp_min_abs_sum, temp_max_count, temp_max_abs_sum, max_abs_move
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(area_code, lead_days) DO UPDATE SET
+            comparisons = comparisons + excluded.comparisons,
+            weather_changes = weather_changes + excluded.weather_changes,
+            temp_min_count = temp_min_count + excluded.temp_min_count,
+            temp_min_abs_sum = temp_min_abs_sum + excluded.temp_min_abs_sum,
+            temp_max_count = temp_max_count + excluded.temp_max_count,
+            temp_max_abs_sum = temp_max_abs_sum + excluded.temp_max_abs_sum,
+            max_abs_move = MAX(COALESCE(max_abs_move, excluded.max_abs_move),
+                               COALESCE(excluded.max_abs_move, max_abs_move))
+    """, [(area_code, lead, *stats) for lead, stats in revisions.items()])
+    conn.execute("""
+        INSERT INTO analytics_progress (area_code, last_fetched_at, snapshot_id) VALUES (?, ?, ?)
+        ON CONFLICT(area_code) DO UPDATE SET
+            last_fetched_at = excluded.last_fetched_at,
+            snapshot_id = excluded.snapshot_id
+    """, (area_code, fetched_at, snapshot_id))
+
+
+def _progress(conn, area_code):
+    """(集計済みの最後の取得日時, そのスナップショット) or None"""
+    return conn.execute("""
+        SELECT last_fetched_at, snapshot_id FROM analytics_progress WHERE area_code = ?
+    """, (area_code,)).fetchone()
+
+
+def _catch_up_area(conn, area_code):
+    """地域の未集計の取得を古い順に集計する。集計した取得の数を返す"""
+    last_fetched_at, snapshot_id = _progress(conn, area_code) or ("", None)
+    runs = conn.execute("""
+        SELECT fetched_at, snapshot_id FROM fetch_runs
+        WHERE area_code = ? AND fetched_at > ?
+        ORDER BY fetched_at
+    """, (area_code, last_fetched_at)).fetchall()
+
+    previous = weather_db.load_snapshot(conn, snapshot_id) if snapshot_id is not None else {}
+    for fetched_at, run_snapshot_id in runs:
+        # 内容が変わっていない取得は読み直さず、変わっていれば直前の取得との差分だけを読む
+        if run_snapshot_id is None:
+            content = {}
+        else:
+            content = weather_db.load_snapshot_after(conn, run_snapshot_id, snapshot_id, previous)
+        _apply(conn, area_code, fetched_at, run_snapshot_id, content, previous)
+        previous, snapshot_id = content, run_snapshot_id
+    return len(runs)
+
+
+def _clear(conn, area_code=None):
+    where, params = ("WHERE area_code = ?", (area_code,)) if area_code else ("", ())
+    for table in ("forecast_day_stats", "forecast_revisions", "analytics_progress"):
+        conn.execute(f"DELETE FROM {table} {where}", params)
+
+
+def _on_save(conn, area_code, fetched_at, snapshot_id, content, previous):
+    """weather_db.save_content から保存のたびに呼ばれる"""
+    if conn is not weather_db.get_connection():
+        # アーカイブDBなど、weather.db 以外への保存は集計しない
+        return
+    progress = _progress(conn, area_code)
+    if progress is not None and fetched_at <= progress[0]:
+        # 集計済みの取得より古い（または同じ）取得を書き直した → 地域ごと作り直す
+        _clear(conn, area_code)
+        _catch_up_area(conn, area_code)
+        return
+    pending = conn.execute("""
+        SELECT 1 FROM fetch_runs
+        WHERE area_code = ? AND fetched_at > ? AND fetched_at != ?
+        LIMIT 1
+    """, (area_code, progress[0] if progress else "", fetched_at)).fetchone()
+    if pending:
+        # ほかのプロセスが保存した未集計の取得がある → 今回の分も含めて古い順に集計する
+        _catch_up_area(conn, area_code)
+        return
+    _apply(conn, area_code, fetched_at, snapshot_id, content, previous)
+
+
+def register():
+    """保存のたびに集計表を更新するよう weather_db に登録する（何度呼んでもよい）"""
+    weather_db.add_save_hook(_on_save)
+
+
+def catch_up():
+    """全地域の未集計の取得を集計する。集計した取得の数を返す"""
+    with weather_db.transaction() as conn:
+        area_codes = [row[0] for row in conn.execute("SELECT DISTINCT area_code FROM fetch_runs")]
+        return sum(_catch_up_area(conn, area_code) for area_code in area_codes)
+
+
+def rebuild(area_code=None):
+    """集計表を残っている取得から作り直す（area_code を指定するとその地域だけ）"""
+    with weather_db.transaction() as conn:
+        _clear(conn, area_code)
+        if area_code:
+            return _catch_up_area(conn, area_code)
+        area_codes = [row[0] for row in conn.execute("SELECT DISTINCT area_code FROM fetch_runs")]
+        return sum(_catch_up_area(conn, code) for code in area_codes)
+
+
+def day_stats(area_code, start=None, end=None):
+    """地域の予報対象日ごとの集計（日付順、start〜end は予報対象日で絞り込み）"""
+    sql = """
+        SELECT forecast_date, fetches, weather_changes,
+               temp_min_low, temp_min_high, temp_max_low, temp_max_high,
+               first_fetched_at, last_fetched_at
+        FROM forecast_day_stats
+        WHERE area_code = ?
+    """
+    params = [area_code]
+    if start:
+        sql += " AND forecast_date >= ?"
+        params.append(start)
+    if end:
+        sql += " AND forecast_date <= ?"
+        params.append(end)
+    cursor = weather_db.get_connection().execute(sql + " ORDER BY forecast_date", params)
+    return [DayStats(*row) for row in cursor]
+
+
+def most_changed_days(area_code=None, limit=10):
+    """天気の予報が何度も変わった予報対象日 [(地域コード, DayStats), ...]"""
+    where, params = ("WHERE area_code = ?", [area_code]) if area_code else ("", [])
+    cursor = weather_db.get_connection().execute(f"""
+        SELECT area_code, forecast_date, fetches, weather_changes,
+               temp_min_low, temp_min_high, temp_max_low, temp_max_high,
+               first_fetched_at, last_fetched_at
+        FROM forecast_day_stats
+        {where}
+        ORDER BY weather_changes DESC, forecast_date DESC
+        LIMIT ?
+    """, params + [limit])
+    return [(row[0], DayStats(*row[1:])) for row in cursor]
+
+
+def revision_stats(area_code=None):
+    """何日先の予報かごとの予報の変化（area_code を省略すると全地域の合計）"""
+    where, params = ("WHERE area_code = ?", (area_code,)) if area_code else ("", ())
+    cursor = weather_db.get_connection().execute(f"""
+        SELECT lead_days, SUM(comparisons), SUM(weather_changes),
+               SUM(temp_min_count), SUM(temp_min_abs_sum),
+               SUM(temp_max_count), SUM(temp_max_abs_sum), MAX(max_abs_move)
+        FROM forecast_revisions
+        {where}
+        GROUP BY lead_days
+        ORDER BY lead_days
+    """, params)
+    return [
+        RevisionStats(
+            lead_days,
+            comparisons,
+            weather_changes / comparisons if comparisons else 0.0,
+            min_sum / min_count if min_count else None,
+            max_sum / max_count if max_count else None,
+            max_abs_move,
+        )
+        for lead_days, comparisons, weather_changes, min_count, min_sum, max_count, max_sum, max_abs_move
+        in cursor
+    ]
+
+
+def _format_move(value):
+    return "-" if value is None else f"{value:.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="予報履歴の集計")
+    parser.add_argument("--db", default=weather_db.DB_PATH, help="DBファイルのパス")
+    parser.add_argument("--area", help="予報対象日ごとの集計を表示する地域コード")
+    parser.add_argument("--rebuild", action="store_true", help="集計表を作り直す")
+    args = parser.parse_args()
+
+    weather_db.DB_PATH = args.db
+    weather_db.init_database()
+    register()
+    if args.rebuild:
+        print(f"{rebuild(args.area)}件の取得から集計表を作り直しました")
+    else:
+        print(f"未集計の取得を{catch_up()}件集計しました")
+
+    if args.area:
+        print(f"{'予報対象日':<12}{'回数':>5}{'天気変化':>8}  最低気温の幅  最高気温の幅")
+        for s in day_stats(args.area):
+            print(
+                f"{s.forecast_date:<12}{s.fetches:>6}{s.weather_changes:>10}  "
+                f"{s.temp_min_low}〜{s.temp_min_high}\t{s.temp_max_low}〜{s.temp_max_high}"
+            )
+
+    print(f"\n{'何日先':>6}{'比較数':>8}{'天気変化率':>10}{'最低気温':>10}{'最高気温':>10}{'最大':>8}  (変化の平均, ℃)")
+    for r in revision_stats(args.area):
+        print(
+            f"{r.lead_days:>6}{r.comparisons:>9}{r.weather_change_rate:>12.0%}"
+            f"{_format_move(r.temp_min_mean_move):>12}{_format_move(r.temp_max_mean_move):>12}"
+            f"{_format_move(r.max_abs_move):>10}"
+        )
+
+    print("\n天気の予報がよく変わった日:")
+    for area_code, s in most_changed_days(args.area):
+        print(f"  {area_code} {s.forecast_date} {s.weather_changes}回（{s.fetches}回の取得）")
+    weather_db.close_all()
+
+
+if __name__ == "__main__":
+    main()
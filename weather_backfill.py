@@ -0,0 +1,261 @@
+"""保存した生のレスポンスを解析し直して予報履歴を作り直すコマンド
+
+weather_raw に保存した予報のJSONを今の split_forecast で解析し直し、weather.db の
+同じ地域・同じ取得日時の予報を書き換える（解析の修正や項目の追加を過去の取得にも反映する）。
+
+- 解析は複数のプロセスで並列に行う（同じ本文は1回だけ解析する）
+- 保存は取得日時の古い順に batch_size 件ずつ1トランザクションにまとめる
+- 保存中は集計表を更新せず、最後に書き換えた地域の集計表だけを作り直す
+
+保持ポリシーで間引いた取得は、--restore-missing を付けない限り作り直さない。
+
+使い方:
+    python weather_backfill.py                              # 全プロセッサで解析し直す
+    python weather_backfill.py --workers 4 --since 2025-01-01 --until 2025-03-31
+    python weather_backfill.py --restore-missing            # weather.db にない取得も追加する
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import weather_analytics
+import weather_db
+import weather_raw
+from weather_service import split_forecast
+
+# 1トランザクションで保存する取得の数
+BATCH_SIZE = 500
+
+# ワーカープロセスが読む生のレスポンスのDB
+_worker_raw_path = None
+
+
+def _init_worker(raw_path):
+    global _worker_raw_path
+    _worker_raw_path = raw_path
+
+
+def _parse_payloads(tasks):
+    """本文を読み出して解析する（ワーカープロセスで実行）
+
+    tasks は (payload_id, area_code, area_name) のリスト。
+    戻り値は [(payload_id, area_code, 地域ごとの日別データ or None, エラー or None), ...] と解析の秒数。
+    """
+    started = time.perf_counter()
+    results = []
+    for payload_id, area_code, area_name in tasks:
+        try:
+            forecast_data = json.loads(weather_raw.load_payload(payload_id, _worker_raw_path))
+            areas = split_forecast(forecast_data, area_code, area_name or "")
+            results.append((payload_id, area_code, areas, None))
+        except Exception as e:
+            results.append((payload_id, area_code, None, str(e) or type(e).__name__))
+    return results, time.perf_counter() - started
+
+
+@dataclass
+class BackfillReport:
+    """作り直しの結果
+
+    changed_runs は解析し直して内容が変わった取得、added_runs は weather.db になかった取得の数。
+    parse_time は全プロセスの解析時間の合計。
+    """
+    responses: int = 0
+    payloads: int = 0
+    saved_areas: int = 0
+    raw_bytes: int = 0
+    changed_runs: int = 0
+    added_runs: int = 0
+    failures: list = field(default_factory=list)
+    workers: int = 0
+    parse_time: float = 0.0
+    save_time: float = 0.0
+    analytics_time: float = 0.0
+    removed_snapshots: int = 0
+    elapsed: float = 0.0
+
+    def throughput(self):
+        """(取得/秒, 本文のMB/秒)"""
+        if not self.elapsed:
+            return 0.0, 0.0
+        return self.responses / self.elapsed, self.raw_bytes / 1e6 / self.elapsed
+
+    def summary(self):
+        per_second, mb_per_second = self.throughput()
+        return (
+            f"{self.responses}件の取得を解析し直し（本文{self.payloads}件, {self.workers}プロセス）: "
+            f"{self.saved_areas}地域分を保存（内容が変わった取得{self.changed_runs}件, 追加{self.added_runs}件）, "
+            f"失敗{len(self.failures)}件, {self.elapsed:.1f}秒 "
+            f"（{per_second:.0f}件/秒, {mb_per_second:.1f}MB/秒） "
+            f"解析{self.parse_time:.1f}秒（合計） 保存{self.save_time:.1f}秒 "
+            f"集計{self.analytics_time:.1f}秒, スナップショット削除{self.removed_snapshots}件"
+        )
+
+
+def backfill_targets(since=None, until=None, restore_missing=False, raw_path=None):
+    """解析し直す取得（取得日時の古い順）
+
+    restore_missing でなければ weather.db に残っている取得だけにする。
+    """
+    responses = weather_raw.list_responses(since, until, raw_path)
+    if restore_missing:
+        return responses
+    existing = set(weather_db.get_connection().execute(
+        "SELECT area_code, fetched_at FROM fetch_runs"
+    ))
+    return [r for r in responses if (r.area_code, r.fetched_at) in existing]
+
+
+def _run_snapshots(batch):
+    """バッチの取得日時の範囲にある取得 {(地域コード, 取得日時): snapshot_id}"""
+    cursor = weather_db.get_connection().execute("""
+        SELECT area_code, fetched_at, snapshot_id FROM fetch_runs
+        WHERE fetched_at BETWEEN ? AND ?
+    """, (batch[0].fetched_at, batch[-1].fetched_at))
+    return {(area_code, fetched_at): snapshot_id for area_code, fetched_at, snapshot_id in cursor}
+
+
+def _submit(executor, batch, workers):
+    """バッチ内の本文の解析をワーカーに割り振る（同じ本文・地域は1回だけ）"""
+    tasks = list(dict.fromkeys((r.payload_id, r.area_code, r.area_name) for r in batch))
+    size = max(1, -(-len(tasks) // (workers * 2)))
+    return [
+        executor.submit(_parse_payloads, tasks[i:i + size])
+        for i in range(0, len(tasks), size)
+    ]
+
+
+def backfill(since=None, until=None, restore_missing=False, workers=None,
+             batch_size=BATCH_SIZE, on_progress=None, raw_path=None):
+    """生のレスポンスを解析し直して予報履歴を書き換え、BackfillReport を返す
+
+    解析は workers 個のプロセス（省略時はプロセッサの数）で並列に行い、次のバッチの解析と
+    今のバッチの保存を重ねる。on_progress(done, total) を渡すとバッチを保存するごとに呼ぶ。
+    """
+    raw_path = raw_path or weather_raw.raw_db_path()
+    workers = workers or os.cpu_count() or 1
+    report = BackfillReport(workers=workers)
+    started = time.perf_counter()
+
+    targets = backfill_targets(since, until, restore_missing, raw_path)
+    report.responses = len(targets)
+    if not targets:
+        report.elapsed = time.perf_counter() - started
+        return report
+    touched = set()
+
+    def save(batch, futures):
+        parsed = {}
+        for future in futures:
+            results, parse_time = future.result()
+            report.parse_time += parse_time
+            report.payloads += len(results)
+            for payload_id, area_code, areas, error in results:
+                parsed[payload_id, area_code] = (areas, error)
+
+        forecasts = []
+        for r in batch:
+            areas, error = parsed[r.payload_id, r.area_code]
+            if error:
+                report.failures.append((r.area_code, r.fetched_at, error))
+                continue
+            report.raw_bytes += r.raw_size
+            forecasts.extend((code, name, days, r.fetched_at) for code, name, days in areas)
+            touched.update(code for code, _, _ in areas)
+
+        save_started = time.perf_counter()
+        before = _run_snapshots(batch)
+        with weather_db.suspend_save_hooks():
+            weather_db.save_forecasts_bulk(forecasts, verbose=False)
+        for key, snapshot_id in _run_snapshots(batch).items():
+            if key not in before:
+                report.added_runs += 1
+            elif before[key] != snapshot_id:
+                report.changed_runs += 1
+        report.save_time += time.perf_counter() - save_started
+        report.saved_areas += len(forecasts)
+
+    # spawn ならどのOSでも同じ動きになり、親の SQLite 接続を子に引き継がない
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context,
+        initializer=_init_worker, initargs=(raw_path,),
+    ) as executor:
+        pending = deque()
+        done = 0
+        for i in range(0, len(targets), batch_size):
+            batch = targets[i:i + batch_size]
+            pending.append((batch, _submit(executor, batch, workers)))
+            # 次のバッチを解析している間に、前のバッチを保存する
+            if len(pending) > 1:
+                batch, futures = pending.popleft()
+                save(batch, futures)
+                done += len(batch)
+                if on_progress:
+                    on_progress(done, len(targets))
+        while pending:
+            batch, futures = pending.popleft()
+            save(batch, futures)
+            done += len(batch)
+            if on_progress:
+                on_progress(done, len(targets))
+
+    analytics_started = time.perf_counter()
+    with weather_db.transaction() as conn:
+        report.removed_snapshots = weather_db.collect_garbage(conn)
+    for area_code in sorted(touched):
+        weather_analytics.rebuild(area_code)
+    report.analytics_time = time.perf_counter() - analytics_started
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="保存した生のレスポンスから予報履歴を作り直す")
+    parser.add_argument("--db", default=weather_db.DB_PATH, help="DBファイルのパス")
+    parser.add_argument("--raw-db", help="生のレスポンスのDBのパス（省略時は --db の隣の _raw.db）")
+    parser.add_argument("--workers", type=int, help="解析するプロセスの数（省略時はプロセッサの数）")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="1トランザクションで保存する取得の数")
+    parser.add_argument("--since", help="この取得日時（YYYY-MM-DD でもよい）以降だけ")
+    parser.add_argument("--until", help="この取得日時（YYYY-MM-DD でもよい）以前だけ")
+    parser.add_argument("--restore-missing", action="store_true",
+                        help="weather.db にない取得（保持ポリシーで間引いた分など）も追加する")
+    args = parser.parse_args()
+
+    weather_db.DB_PATH = args.db
+    weather_db.init_database()
+    weather_analytics.register()
+    raw_path = args.raw_db or weather_raw.raw_db_path()
+    if not os.path.exists(raw_path):
+        parser.exit(1, f"{raw_path} がありません（予報を取得すると作られます）\n")
+    print(f"{raw_path}: {weather_raw.raw_stats(raw_path)}")
+
+    started = time.perf_counter()
+
+    def show_progress(done, total):
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0.0
+        print(f"\r  {done}/{total}件 ({done / total:.0%}, {rate:.0f}件/秒)", end="", flush=True)
+
+    try:
+        report = backfill(
+            args.since, args.until, args.restore_missing, args.workers,
+            args.batch_size, show_progress, raw_path,
+        )
+        print()
+        for area_code, fetched_at, error in report.failures[:10]:
+            print(f"  失敗: {area_code} {fetched_at} {error}")
+        print(report.summary())
+    finally:
+        weather_db.close_all()
+    if report.failures:
+        parser.exit(1)
+
+
+if __name__ == "__main__":
+    main()
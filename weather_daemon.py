@@ -0,0 +1,162 @@
+"""気象庁の発表時刻に合わせて全地域の予報を定期取得する常駐プロセス
+
+Fletを読み込まないので、サーバー上でUIなしに動かせる。
+気象庁の天気予報は毎日 5時・11時・17時（日本時間）に発表されるので、
+その少し後に全オフィスを取得する。停止中に発表時刻を過ぎていた場合は起動直後に取得する。
+
+使い方:
+    python weather_daemon.py                 # 常駐して定期取得
+    python weather_daemon.py --once          # 1回だけ取得して終了
+    python weather_daemon.py --retention     # 毎日5時の取得後に保持ポリシーも適用
+"""
+import argparse
+import random
+import signal
+import threading
+from datetime import datetime, timedelta, timezone
+
+import weather_analytics
+import weather_db
+from jma_client import JmaClient
+from weather_retention import apply_retention
+from weather_service import sync_all_offices
+from weather_sync import load_offices
+
+JST = timezone(timedelta(hours=9), "JST")
+
+# 気象庁の天気予報の発表時刻（日本時間）
+PUBLISH_HOURS = (5, 11, 17)
+# 発表時刻から取得までの待ち時間（発表直後はまだ更新されていないことがある）
+PUBLISH_DELAY = timedelta(minutes=10)
+# 取得時刻のばらつき（秒）。複数台で動かしても同時にアクセスしないように
+MAX_JITTER = 120
+# 失敗した地域の再試行（回数と初回の待ち時間、2回目以降は倍にする）
+MAX_RETRIES = 3
+RETRY_DELAY = 60
+# 1回分の同期ができなかったとき（通信できず地域もない、DBのエラーなど）に次に試すまでの秒数
+SLOT_RETRY_DELAY = 300
+
+STATE_KEY = "daemon_last_slot"
+
+
+def publish_slots(now):
+    """now 以前で最も新しい取得予定時刻と、次の取得予定時刻"""
+    now = now.astimezone(JST)
+    slots = []
+    for day_offset in (-1, 0, 1):
+        day = (now + timedelta(days=day_offset)).date()
+        for hour in PUBLISH_HOURS:
+            slot = datetime(day.year, day.month, day.day, hour, tzinfo=JST) + PUBLISH_DELAY
+            slots.append(slot)
+    previous = max(slot for slot in slots if slot <= now)
+    upcoming = min(slot for slot in slots if slot > now)
+    return previous, upcoming
+
+
+class IngestDaemon:
+    """発表時刻ごとに全オフィスを同期するスケジューラー"""
+
+    def __init__(self, client, concurrency=8, retention=False):
+        self.client = client
+        self.concurrency = concurrency
+        self.retention = retention
+        self.stop_event = threading.Event()
+
+    def stop(self, *args):
+        print("停止します")
+        self.stop_event.set()
+
+    def _sleep(self, seconds):
+        """停止要求が来たら True"""
+        return self.stop_event.wait(max(0.0, seconds))
+
+    def _last_slot(self):
+        value = weather_db.get_state(STATE_KEY)
+        return datetime.fromisoformat(value) if value else None
+
+    def run_slot(self, slot):
+        """1回分の同期（失敗した地域だけ間隔を空けて再試行）"""
+        print(f"[{datetime.now(JST):%Y-%m-%d %H:%M:%S}] {slot:%m/%d %H:%M} 発表分を取得")
+        offices = load_offices(self.client)
+        if not offices:
+            print("同期する地域がありません")
+            return False
+
+        pending = offices
+        delay = RETRY_DELAY
+        for attempt in range(MAX_RETRIES + 1):
+            report = sync_all_offices(self.client, pending, concurrency=self.concurrency)
+            print(report.summary())
+            failed = {r.area_code for r in report.failures}
+            if not failed:
+                break
+            for r in report.failures:
+                print(f"  失敗 {r.area_code} {r.area_name}: {r.error}")
+            if attempt == MAX_RETRIES:
+                print(f"{len(failed)}地域は再試行しても取得できませんでした")
+                break
+            print(f"{delay}秒後に{len(failed)}地域を再試行（{attempt + 1}/{MAX_RETRIES}）")
+            if self._sleep(delay):
+                return False
+            pending = {code: info for code, info in pending.items() if code in failed}
+            delay *= 2
+
+        # 一部の地域が失敗しても、この発表分は取得済みとして記録する
+        weather_db.set_state(STATE_KEY, slot.isoformat())
+        if self.retention and slot.hour == PUBLISH_HOURS[0]:
+            apply_retention()
+        return True
+
+    def run(self):
+        """停止されるまで発表時刻ごとに同期"""
+        while not self.stop_event.is_set():
+            previous, upcoming = publish_slots(datetime.now(JST))
+            last = self._last_slot()
+            if last is None or last < previous:
+                # 停止中に過ぎた発表分をすぐに取得（複数回分逃していても最新の1回だけ）
+                try:
+                    done = self.run_slot(previous)
+                except Exception as e:
+                    # 常駐を止めないよう、エラーを表示して間隔を空けてから取得し直す
+                    print(f"取得に失敗: {type(e).__name__}: {e}")
+                    done = False
+                if not done:
+                    print(f"{SLOT_RETRY_DELAY}秒後に取得し直します")
+                    if self._sleep(SLOT_RETRY_DELAY):
+                        break
+                continue
+
+            wait = (upcoming - datetime.now(JST)).total_seconds() + random.uniform(0, MAX_JITTER)
+            print(f"次回の取得: {upcoming:%m/%d %H:%M} 頃（{wait / 60:.0f}分後）")
+            if self._sleep(wait):
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="気象庁の発表時刻に合わせて予報を定期取得")
+    parser.add_argument("--db", default=weather_db.DB_PATH, help="DBファイルのパス")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に取得する地域数")
+    parser.add_argument("--once", action="store_true", help="1回だけ取得して終了")
+    parser.add_argument("--retention", action="store_true", help="毎日5時の取得後に保持ポリシーを適用")
+    args = parser.parse_args()
+
+    weather_db.DB_PATH = args.db
+    weather_db.init_database()
+    weather_analytics.register()
+    # 定期取得では鮮度の期間を使わず、毎回条件付きGETで確認する
+    client = JmaClient(forecast_max_age=0, pool_size=args.concurrency)
+    daemon = IngestDaemon(client, concurrency=args.concurrency, retention=args.retention)
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+
+    try:
+        if args.once:
+            daemon.run_slot(publish_slots(datetime.now(JST))[0])
+        else:
+            daemon.run()
+    finally:
+        weather_db.close_all()
+
+
+if __name__ == "__main__":
+    main()
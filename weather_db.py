@@ -0,0 +1,1161 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# データベースファイルのパス
+DB_PATH = "weather.db"
+
+# 接続ごとに設定するPRAGMA
+# WALモードにすると読み取りが書き込みをブロックしない
+# auto_vacuum は新規DBでテーブル作成前に設定したときだけ有効になる
+PRAGMAS = (
+    ("auto_vacuum", "INCREMENTAL"),
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),     # WALならNORMALでもDBは壊れない
+    ("cache_size", -16000),        # ページキャッシュ約16MB（負の値はKB指定）
+    ("mmap_size", 64 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),
+    ("foreign_keys", "ON"),
+)
+
+# 接続ごとにキャッシュするプリペアドステートメントの数
+STATEMENT_CACHE_SIZE = 128
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+# close_all() のたびに増やす。スレッドの接続が古い世代なら閉じられているので開き直す
+_generation = 0
+# SQLiteの書き込みは同時に1つだけなので、プロセス内ではロックで順番待ちさせる
+_write_lock = threading.RLock()
+
+
+def _open_connection(db_path):
+    """PRAGMAを設定した接続を作成"""
+    conn = sqlite3.connect(
+        db_path,
+        isolation_level=None,  # トランザクションは transaction() で明示的に開始する
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def get_connection(db_path=None):
+    """スレッドごとの長寿命接続を取得（初回と close_all() の後だけ接続を作成）"""
+    db_path = db_path or DB_PATH
+    if getattr(_local, "generation", None) != _generation:
+        # 初回か、別のスレッドの close_all() で接続が閉じられた
+        _local.connections = {}
+        _local.pending = {}
+        _local.generation = _generation
+    conns = _local.connections
+
+    conn = conns.get(db_path)
+    if conn is None:
+        conn = _open_connection(db_path)
+        conns[db_path] = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+@contextmanager
+def transaction(db_path=None):
+    """書き込みトランザクション（成功時COMMIT、例外時ROLLBACK）"""
+    conn = get_connection(db_path)
+    with _write_lock:
+        if conn.in_transaction:
+            # ネストした呼び出しは外側のトランザクションに含める
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            _pending_invalidations(conn).clear()
+            raise
+        else:
+            conn.execute("COMMIT")
+            # コミットしてから読み取りキャッシュを消す（コミット前の古い値を入れ直させない）
+            pending = _pending_invalidations(conn)
+            if pending:
+                _query_cache.invalidate_runs(db_path or DB_PATH, pending)
+                pending.clear()
+
+
+def close_all():
+    """全スレッドの接続を閉じる（アプリ終了時用）
+
+    閉じた後にどのスレッドが get_connection() を呼んでも、新しい接続を開き直す。
+    """
+    global _generation
+    with _connections_lock:
+        conns = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _query_cache.clear()
+
+
+# 読み取り結果のキャッシュ（件数の上限と、他のプロセスの書き込みを拾うための有効期間）
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_TTL = 60
+
+
+@dataclass
+class CacheStats:
+    """読み取りキャッシュの統計"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    size: int = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self):
+        return (
+            f"ヒット{self.hits}件, ミス{self.misses}件 (ヒット率{self.hit_rate:.0%}), "
+            f"追い出し{self.evictions}件, 無効化{self.invalidations}件, 保持{self.size}件"
+        )
+
+
+class QueryCache:
+    """LRUの読み取りキャッシュ（キーは (DBパス, 種類, 地域コード, ...)）"""
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 無効化のたびに増やす。読み取り中に書き込みがあった結果は入れない
+        self._generation = 0
+        self._stats = CacheStats()
+
+    def token(self):
+        """読み取りを始める前に取得し、put() に渡す"""
+        return self._generation
+
+    def get(self, key):
+        """キャッシュされた値（なければ None）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self._stats.misses += 1
+            return None
+
+    def put(self, key, value, token):
+        with self._lock:
+            if token != self._generation:
+                return
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def invalidate_runs(self, db_path, runs):
+        """保存した取得 (地域コード, 取得日) に関係するキーだけを消す"""
+        with self._lock:
+            self._generation += 1
+            for area_code, fetch_date in runs:
+                for key in (
+                    (db_path, "forecasts", area_code, "latest"),
+                    (db_path, "forecasts", area_code, fetch_date),
+                    (db_path, "dates", area_code),
+                ):
+                    if self._entries.pop(key, None) is not None:
+                        self._stats.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._stats.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(
+                self._stats.hits, self._stats.misses, self._stats.evictions,
+                self._stats.invalidations, len(self._entries),
+            )
+
+
+_query_cache = QueryCache()
+
+
+def _pending_invalidations(conn):
+    """トランザクション中に保存した取得の集合（コミット時にキャッシュから消す）"""
+    pending = getattr(_local, "pending", None)
+    if pending is None:
+        pending = _local.pending = {}
+    return pending.setdefault(id(conn), set())
+
+
+def query_cache_stats():
+    """読み取りキャッシュの統計"""
+    return _query_cache.stats()
+
+
+def clear_query_cache():
+    """読み取りキャッシュを空にする（DBを直接書き換えたあとなど）"""
+    _query_cache.clear()
+
+
+def _migrate_v1_base_schema(conn):
+    """v1: 最初の版のテーブル（既存DBでは何もしない）"""
+    # エリア情報テーブル（オプション機能）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS areas (
+            area_code TEXT PRIMARY KEY,
+            area_name TEXT NOT NULL,
+            parent_code TEXT,
+            area_type TEXT NOT NULL
+        )
+    """)
+
+    # 天気予報テーブル
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS forecasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            area_code TEXT NOT NULL,
+            area_name TEXT NOT NULL,
+            forecast_date TEXT NOT NULL,
+            weather TEXT,
+            temp_min TEXT,
+            temp_max TEXT,
+            fetched_at TEXT NOT NULL,
+            UNIQUE(area_code, forecast_date, fetched_at)
+        )
+    """)
+
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_forecasts_area_date
+        ON forecasts(area_code, forecast_date)
+    """)
+
+
+def _migrate_v2_fetch_runs(conn):
+    """v2: 取得1回分を fetch_runs に分離し、forecasts から参照する"""
+    # 取得履歴テーブル
+    # UNIQUE(area_code, fetched_at) のインデックスで「最新の取得」を1回のシークで引ける
+    conn.execute("""
+        CREATE TABLE fetch_runs (
+            run_id INTEGER PRIMARY KEY,
+            area_code TEXT NOT NULL,
+            area_name TEXT NOT NULL,
+            fetched_at TEXT NOT NULL,
+            fetch_date TEXT NOT NULL,
+            UNIQUE(area_code, fetched_at)
+        )
+    """)
+    # 「X日の取得分」「取得日一覧」用のカバリングインデックス
+    conn.execute("""
+        CREATE INDEX idx_fetch_runs_area_fetch_date
+        ON fetch_runs(area_code, fetch_date, fetched_at)
+    """)
+    conn.execute("""
+        INSERT INTO fetch_runs (area_code, area_name, fetched_at, fetch_date)
+        SELECT area_code, MAX(area_name), fetched_at, DATE(fetched_at)
+        FROM forecasts
+        GROUP BY area_code, fetched_at
+        ORDER BY fetched_at
+    """)
+
+    conn.execute("""
+        CREATE TABLE forecasts_v2 (
+            run_id INTEGER NOT NULL REFERENCES fetch_runs(run_id) ON DELETE CASCADE,
+            forecast_date TEXT NOT NULL,
+            weather TEXT,
+            temp_min TEXT,
+            temp_max TEXT,
+            PRIMARY KEY (run_id, forecast_date)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        INSERT INTO forecasts_v2 (run_id, forecast_date, weather, temp_min, temp_max)
+        SELECT r.run_id, f.forecast_date, f.weather, f.temp_min, f.temp_max
+        FROM forecasts f
+        JOIN fetch_runs r ON r.area_code = f.area_code AND r.fetched_at = f.fetched_at
+    """)
+    conn.execute("DROP TABLE forecasts")
+    conn.execute("ALTER TABLE forecasts_v2 RENAME TO forecasts")
+
+
+def _numeric_sql(column):
+    """TEXTの気温を数値に変換するSQL式（空文字や数値でない値はNULL）"""
+    return f"""
+        CASE WHEN TRIM({column}) GLOB '*[0-9]*'
+                  AND TRIM({column}) NOT GLOB '*[^0-9.+-]*'
+             THEN CAST(TRIM({column}) AS REAL)
+        END
+    """
+
+
+def _migrate_v3_typed_columns(conn):
+    """v3: 気温を数値型に、天気を天気コード＋文字列テーブルに変更"""
+    # 長い天気文字列は1回だけ保存し、forecasts からはIDで参照する
+    conn.execute("""
+        CREATE TABLE weather_texts (
+            text_id INTEGER PRIMARY KEY,
+            text TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.execute("""
+        INSERT INTO weather_texts (text)
+        SELECT DISTINCT weather FROM forecasts WHERE weather IS NOT NULL
+    """)
+
+    # INTEGER型の列に入れた実数は、整数で表せる値なら自動的に整数で保存される
+    conn.execute("""
+        CREATE TABLE forecasts_v3 (
+            run_id INTEGER NOT NULL REFERENCES fetch_runs(run_id) ON DELETE CASCADE,
+            forecast_date TEXT NOT NULL,
+            weather_code INTEGER,
+            weather_id INTEGER REFERENCES weather_texts(text_id),
+            temp_min INTEGER,
+            temp_max INTEGER,
+            PRIMARY KEY (run_id, forecast_date)
+        ) WITHOUT ROWID
+    """)
+    # 旧データには天気コードが保存されていないので weather_code はNULL
+    conn.execute(f"""
+        INSERT INTO forecasts_v3 (run_id, forecast_date, weather_id, temp_min, temp_max)
+        SELECT f.run_id, f.forecast_date, t.text_id,
+               {_numeric_sql("f.temp_min")}, {_numeric_sql("f.temp_max")}
+        FROM forecasts f
+        LEFT JOIN weather_texts t ON t.text = f.weather
+    """)
+    conn.execute("DROP TABLE forecasts")
+    conn.execute("ALTER TABLE forecasts_v3 RENAME TO forecasts")
+
+
+def _migrate_v4_snapshots(conn):
+    """v4: 予報を内容ハッシュ付きのスナップショット（前回との差分）として保存"""
+    conn.execute("""
+        CREATE TABLE snapshots (
+            snapshot_id INTEGER PRIMARY KEY,
+            payload_hash TEXT NOT NULL UNIQUE,
+            base_id INTEGER REFERENCES snapshots(snapshot_id),
+            depth INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        ALTER TABLE fetch_runs
+        ADD COLUMN snapshot_id INTEGER REFERENCES snapshots(snapshot_id)
+    """)
+    conn.execute("ALTER TABLE forecasts RENAME TO forecasts_v3")
+    conn.execute("""
+        CREATE TABLE forecasts (
+            snapshot_id INTEGER NOT NULL REFERENCES snapshots(snapshot_id) ON DELETE CASCADE,
+            forecast_date TEXT NOT NULL,
+            changed INTEGER NOT NULL,
+            weather_code INTEGER,
+            weather_id INTEGER REFERENCES weather_texts(text_id),
+            temp_min INTEGER,
+            temp_max INTEGER,
+            PRIMARY KEY (snapshot_id, forecast_date)
+        ) WITHOUT ROWID
+    """)
+
+    # 既存の取得を地域ごとに古い順に変換（同じ内容の取得はスナップショットを共有する）
+    runs = conn.execute("""
+        SELECT run_id, area_code FROM fetch_runs ORDER BY area_code, fetched_at
+    """).fetchall()
+    base_ids = {}
+    for run_id, area_code in runs:
+        content = {
+            date_str: tuple(day)
+            for date_str, *day in conn.execute("""
+                SELECT f.forecast_date, f.weather_code, t.text, f.temp_min, f.temp_max
+                FROM forecasts_v3 f
+                LEFT JOIN weather_texts t ON t.text_id = f.weather_id
+                WHERE f.run_id = ?
+            """, (run_id,))
+        }
+        snapshot_id, _ = _resolve_snapshot(conn, content, base_ids.get(area_code))
+        base_ids[area_code] = snapshot_id
+        conn.execute(
+            "UPDATE fetch_runs SET snapshot_id = ? WHERE run_id = ?", (snapshot_id, run_id)
+        )
+    conn.execute("DROP TABLE forecasts_v3")
+
+
+def _migrate_v5_ingest_state(conn):
+    """v5: 定期取得の状態（最後に成功した時刻など）を保存するテーブル"""
+    conn.execute("""
+        CREATE TABLE ingest_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+
+
+def _migrate_v6_area_readings(conn):
+    """v6: 地域の検索用に英語名・読み（かな）を保存する"""
+    conn.execute("ALTER TABLE areas ADD COLUMN en_name TEXT")
+    conn.execute("ALTER TABLE areas ADD COLUMN kana TEXT")
+
+
+def _migrate_v7_analytics(conn):
+    """v7: 保存のたびに更新する集計表（weather_analytics が書き込む）"""
+    # 予報対象日ごとの集計（何回予報されたか、気温の予報の幅、天気が変わった回数）
+    conn.execute("""
+        CREATE TABLE forecast_day_stats (
+            area_code TEXT NOT NULL,
+            forecast_date TEXT NOT NULL,
+            fetches INTEGER NOT NULL,
+            weather_changes INTEGER NOT NULL,
+            temp_min_low INTEGER,
+            temp_min_high INTEGER,
+            temp_max_low INTEGER,
+            temp_max_high INTEGER,
+            first_fetched_at TEXT NOT NULL,
+            last_fetched_at TEXT NOT NULL,
+            PRIMARY KEY (area_code, forecast_date)
+        ) WITHOUT ROWID
+    """)
+    # 前回の取得からの予報の変化（何日先の予報か = lead_days ごと）
+    conn.execute("""
+        CREATE TABLE forecast_revisions (
+            area_code TEXT NOT NULL,
+            lead_days INTEGER NOT NULL,
+            comparisons INTEGER NOT NULL,
+            weather_changes INTEGER NOT NULL,
+            temp_min_count INTEGER NOT NULL,
+            temp_min_abs_sum REAL NOT NULL,
+            temp_max_count INTEGER NOT NULL,
+            temp_max_abs_sum REAL NOT NULL,
+            max_abs_move REAL,
+            PRIMARY KEY (area_code, lead_days)
+        ) WITHOUT ROWID
+    """)
+    # 地域ごとにどの取得まで集計したか
+    conn.execute("""
+        CREATE TABLE analytics_progress (
+            area_code TEXT PRIMARY KEY,
+            last_fetched_at TEXT NOT NULL,
+            snapshot_id INTEGER
+        )
+    """)
+
+
+def _migrate_v8_area_hierarchy(conn):
+    """v8: 細分区域（class10/15/20）も保存するので、親コードから子を引くインデックス"""
+    conn.execute("CREATE INDEX idx_areas_parent ON areas(parent_code)")
+
+
+# スキーマのマイグレーション（PRAGMA user_version = 適用済みの数）
+MIGRATIONS = [
+    _migrate_v1_base_schema,
+    _migrate_v2_fetch_runs,
+    _migrate_v3_typed_columns,
+    _migrate_v4_snapshots,
+    _migrate_v5_ingest_state,
+    _migrate_v6_area_readings,
+    _migrate_v7_analytics,
+    _migrate_v8_area_hierarchy,
+]
+
+
+def get_schema_version(conn):
+    """DBのスキーマバージョンを取得"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_path=None):
+    """未適用のマイグレーションを順に適用"""
+    conn = get_connection(db_path)
+    version = get_schema_version(conn)
+    for target in range(version + 1, len(MIGRATIONS) + 1):
+        with transaction(db_path):
+            MIGRATIONS[target - 1](conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+        print(f"スキーマを v{target} に更新")
+    if version < len(MIGRATIONS):
+        _query_cache.clear()
+    return get_schema_version(conn)
+
+
+def get_state(key, default=None):
+    """ingest_state から値を取得"""
+    row = get_connection().execute(
+        "SELECT value FROM ingest_state WHERE key = ?", (key,)
+    ).fetchone()
+    return row[0] if row else default
+
+
+def set_state(key, value):
+    """ingest_state に値を保存"""
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO ingest_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (key, value))
+
+
+def init_database():
+    """データベースの初期化
+
+    集計表を保存のたびに更新するには、続けて weather_analytics.register() を呼ぶ
+    （予報を保存する各コマンドとアプリの共有層が呼ぶ）。
+    """
+    migrate()
+    print("データベース初期化完了")
+
+
+@dataclass
+class WriteStats:
+    """一括書き込みの件数（新規・更新・変更なし）"""
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+
+    def __add__(self, other):
+        return WriteStats(
+            self.inserted + other.inserted,
+            self.updated + other.updated,
+            self.skipped + other.skipped,
+        )
+
+    @property
+    def changed(self):
+        return self.inserted + self.updated
+
+    def __str__(self):
+        return f"新規{self.inserted}件, 更新{self.updated}件, 変更なし{self.skipped}件"
+
+
+def _split_rows(rows, existing):
+    """行を新規・更新・変更なしに振り分ける
+
+    rows と existing はキー -> 値タプルの辞書。
+    """
+    inserts, updates = [], []
+    for key, values in rows.items():
+        old = existing.get(key)
+        if old is None:
+            inserts.append(key + values)
+        elif old != values:
+            updates.append(values + key)
+    skipped = len(rows) - len(inserts) - len(updates)
+    return inserts, updates, skipped
+
+
+def save_areas_to_db(centers, offices, class10s=None, class15s=None, class20s=None):
+    """エリア情報をDBに保存（変更のあった行だけ書き込む）
+
+    class10s〜class20s は area.json の一次細分区域・市町村等をまとめた地域・市町村等。
+    """
+    rows = {}
+    # センター（地方）
+    for code, info in centers.items():
+        rows[(code,)] = (info.get("name", ""), None, "center", info.get("enName"), info.get("kana"))
+    # オフィス（都道府県）
+    for code, info in offices.items():
+        rows[(code,)] = (
+            info.get("name", ""), info.get("parent", ""), "office", info.get("enName"), info.get("kana")
+        )
+    # 細分区域
+    sub_areas = 0
+    for area_type, areas in (("class10", class10s), ("class15", class15s), ("class20", class20s)):
+        for code, info in (areas or {}).items():
+            # 大阪府（270000）のように上の階層と同じコードの区域は、上の階層の行を残す
+            if (code,) in rows:
+                continue
+            rows[(code,)] = (
+                info.get("name", ""), info.get("parent"), area_type, info.get("enName"), info.get("kana")
+            )
+            sub_areas += 1
+
+    with transaction() as conn:
+        existing = {
+            (code,): (name, parent, area_type, en_name, kana)
+            for code, name, parent, area_type, en_name, kana in conn.execute(
+                "SELECT area_code, area_name, parent_code, area_type, en_name, kana FROM areas"
+            )
+        }
+        inserts, updates, skipped = _split_rows(rows, existing)
+        conn.executemany("""
+            INSERT INTO areas (area_code, area_name, parent_code, area_type, en_name, kana)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, inserts)
+        conn.executemany("""
+            UPDATE areas SET area_name = ?, parent_code = ?, area_type = ?, en_name = ?, kana = ?
+            WHERE area_code = ?
+        """, updates)
+
+    stats = WriteStats(len(inserts), len(updates), skipped)
+    print(
+        f"エリア情報を保存: センター{len(centers)}件, オフィス{len(offices)}件, "
+        f"細分区域{sub_areas}件 ({stats})"
+    )
+    return stats
+
+
+def save_area_json(area_data):
+    """気象庁の area.json をそのまま保存"""
+    return save_areas_to_db(
+        area_data.get("centers", {}),
+        area_data.get("offices", {}),
+        area_data.get("class10s"),
+        area_data.get("class15s"),
+        area_data.get("class20s"),
+    )
+
+
+def load_area_hierarchy():
+    """areas テーブルから area.json と同じ形の (centers, offices) を組み立てる
+
+    DBにまだ地域がなければ空の辞書を返す。
+    """
+    conn = get_connection()
+    centers, offices = {}, {}
+    for code, name, parent, area_type, en_name in conn.execute("""
+        SELECT area_code, area_name, parent_code, area_type, en_name FROM areas
+        WHERE area_type IN ('center', 'office')
+        ORDER BY area_code
+    """):
+        if area_type == "center":
+            centers[code] = {"name": name, "enName": en_name, "children": []}
+        else:
+            offices[code] = {"name": name, "enName": en_name, "parent": parent}
+    for code, info in offices.items():
+        if info["parent"] in centers:
+            centers[info["parent"]]["children"].append(code)
+    return centers, offices
+
+
+def load_area_search_entries(area_types=("office",), excluded_offices=()):
+    """地域検索の索引用に (コード, 名前, 英語名, 読み, 親コード, 種類) を読む
+
+    細分区域の親コードは、その区域を含むオフィス（府県予報区）のコードにする。
+    excluded_offices のオフィスに含まれる細分区域は返さない（予報を取得できないので）。
+    """
+    conn = get_connection()
+    placeholders = ", ".join("?" for _ in area_types)
+    excluded = ", ".join("?" for _ in excluded_offices)
+    return conn.execute(f"""
+        WITH RECURSIVE office_of(area_code, office_code) AS (
+            SELECT area_code, area_code FROM areas WHERE area_type = 'office'
+            UNION ALL
+            SELECT a.area_code, o.office_code
+            FROM areas a JOIN office_of o ON a.parent_code = o.area_code
+            WHERE a.area_type IN ('class10', 'class15', 'class20')
+        )
+        SELECT a.area_code, a.area_name, a.en_name, a.kana,
+               CASE WHEN a.area_type IN ('center', 'office') THEN a.parent_code
+                    ELSE o.office_code END,
+               a.area_type
+        FROM areas a
+        LEFT JOIN office_of o ON o.area_code = a.area_code
+        WHERE a.area_type IN ({placeholders})
+          AND (a.area_type IN ('center', 'office') OR o.office_code IS NULL
+               OR o.office_code NOT IN ({excluded}))
+        ORDER BY a.area_code
+    """, tuple(area_types) + tuple(excluded_offices)).fetchall()
+
+
+# 細分区域の階層の深さ（center → office → class10 → class15 → class20）
+MAX_AREA_DEPTH = 5
+
+# 予報を表示する地域（細分区域は一次細分区域の予報を、オフィスはその先頭の区域の予報を使う）
+ForecastArea = namedtuple("ForecastArea", "office_code office_name area_code area_name")
+
+
+def get_area_ancestors(area_code):
+    """地域とその上の階層 [(コード, 名前, 種類), ...]（自分から地方に向かう順）"""
+    return get_connection().execute("""
+        WITH RECURSIVE chain(area_code, area_name, area_type, parent_code, level) AS (
+            SELECT area_code, area_name, area_type, parent_code, 0
+            FROM areas WHERE area_code = ?
+            UNION ALL
+            SELECT a.area_code, a.area_name, a.area_type, a.parent_code, c.level + 1
+            FROM areas a JOIN chain c ON a.area_code = c.parent_code
+            WHERE c.level < ?
+        )
+        SELECT area_code, area_name, area_type FROM chain ORDER BY level
+    """, (area_code, MAX_AREA_DEPTH)).fetchall()
+
+
+def get_area_children(area_code):
+    """すぐ下の階層の地域 [(コード, 名前, 種類), ...]"""
+    return get_connection().execute("""
+        SELECT area_code, area_name, area_type FROM areas
+        WHERE parent_code = ?
+        ORDER BY area_code
+    """, (area_code,)).fetchall()
+
+
+def resolve_forecast_area(area_code):
+    """地域の予報をどこから取得し、どの地域の予報として読むか
+
+    市町村（class20）などは、含まれる一次細分区域（class10）の予報を表示する。
+    予報の取得はオフィス単位（1回の取得で府県内の一次細分区域がすべて埋まる）。
+    areas にない地域はオフィスとして扱う。
+    """
+    ancestors = get_area_ancestors(area_code)
+    office = next((a for a in ancestors if a[2] == "office"), None)
+    if office is None:
+        return ForecastArea(area_code, None, area_code, None)
+    forecast = next(a for a in ancestors if a[2] in ("class10", "office"))
+    return ForecastArea(office[0], office[1], forecast[0], forecast[1])
+
+
+# 差分スナップショットを何段まで重ねるか（超えたら全日分を保存し直す）
+MAX_DELTA_DEPTH = 16
+
+# forecasts.changed のビット（その行で値が入っている列）
+FIELD_WEATHER_CODE = 1
+FIELD_WEATHER = 2
+FIELD_TEMP_MIN = 4
+FIELD_TEMP_MAX = 8
+ALL_FIELDS = FIELD_WEATHER_CODE | FIELD_WEATHER | FIELD_TEMP_MIN | FIELD_TEMP_MAX
+# changed = 0 の行は「その日が予報から消えた」ことを表す
+FIELD_BITS = (FIELD_WEATHER_CODE, FIELD_WEATHER, FIELD_TEMP_MIN, FIELD_TEMP_MAX)
+
+
+def _snapshot_content(weather_data):
+    """parse結果を 日付 -> (weather_code, weather, temp_min, temp_max) に変換"""
+    return {
+        date_str: (
+            data.get("weather_code"),
+            data.get("weather"),
+            data.get("temp_min"),
+            data.get("temp_max"),
+        )
+        for date_str, data in weather_data.items()
+    }
+
+
+def _content_hash(content):
+    """スナップショットの内容ハッシュ（同じ予報なら同じ値になる）"""
+    payload = json.dumps(sorted(content.items()), ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _weather_text_ids(conn, texts):
+    """天気文字列 -> text_id の辞書（未登録の文字列は登録する）"""
+    texts = {text for text in texts if text}
+    if not texts:
+        return {}
+    conn.executemany(
+        "INSERT OR IGNORE INTO weather_texts (text) VALUES (?)",
+        [(text,) for text in texts],
+    )
+    ids = {}
+    for text in texts:
+        ids[text] = conn.execute(
+            "SELECT text_id FROM weather_texts WHERE text = ?", (text,)
+        ).fetchone()[0]
+    return ids
+
+
+def load_snapshot(conn, snapshot_id):
+    """差分を辿ってスナップショットの全日分を復元
+
+    戻り値は 日付 -> (weather_code, weather, temp_min, temp_max) の辞書。
+    """
+    # level は指定したスナップショットからの段数（大きいほど古い）
+    cursor = conn.execute("""
+        WITH RECURSIVE chain(snapshot_id, base_id, level) AS (
+            SELECT snapshot_id, base_id, 0 FROM snapshots WHERE snapshot_id = ?
+            UNION ALL
+            SELECT s.snapshot_id, s.base_id, c.level + 1
+            FROM snapshots s JOIN chain c ON s.snapshot_id = c.base_id
+        )
+        SELECT f.forecast_date, f.changed, f.weather_code, t.text, f.temp_min, f.temp_max
+        FROM chain c
+        JOIN forecasts f ON f.snapshot_id = c.snapshot_id
+        LEFT JOIN weather_texts t ON t.text_id = f.weather_id
+        ORDER BY c.level DESC
+    """, (snapshot_id,))
+
+    return _apply_delta({}, cursor)
+
+
+def _apply_delta(content, rows):
+    """(日付, changed, 値...) の行を古い順に content に重ねる"""
+    for date_str, changed, *values in rows:
+        if changed == 0:
+            content.pop(date_str, None)
+            continue
+        day = list(content.get(date_str, (None, None, None, None)))
+        for i, bit in enumerate(FIELD_BITS):
+            if changed & bit:
+                day[i] = values[i]
+        content[date_str] = tuple(day)
+    return content
+
+
+def load_snapshot_after(conn, snapshot_id, previous_id, previous):
+    """直前に復元したスナップショット（previous_id の内容 previous）を使って復元
+
+    snapshot_id が previous_id との差分ならその差分だけを読む。取得を古い順に
+    たどるときは、ほとんどのスナップショットが直前の取得との差分になっている。
+    """
+    if snapshot_id == previous_id:
+        return previous
+    row = conn.execute(
+        "SELECT base_id FROM snapshots WHERE snapshot_id = ?", (snapshot_id,)
+    ).fetchone()
+    if row is None or previous_id is None or row[0] != previous_id:
+        return load_snapshot(conn, snapshot_id)
+    cursor = conn.execute("""
+        SELECT f.forecast_date, f.changed, f.weather_code, t.text, f.temp_min, f.temp_max
+        FROM forecasts f
+        LEFT JOIN weather_texts t ON t.text_id = f.weather_id
+        WHERE f.snapshot_id = ?
+    """, (snapshot_id,))
+    return _apply_delta(dict(previous), cursor)
+
+
+def _delta_depth(conn, base_id):
+    """base_id に差分を重ねたときの段数（重ねすぎなら None = 全日分を保存）"""
+    if base_id is None:
+        return None
+    base_depth = conn.execute(
+        "SELECT depth FROM snapshots WHERE snapshot_id = ?", (base_id,)
+    ).fetchone()[0]
+    return base_depth + 1 if base_depth < MAX_DELTA_DEPTH else None
+
+
+def _write_snapshot_rows(conn, snapshot_id, content, base):
+    """content を base との差分として forecasts に書き込む"""
+    text_ids = _weather_text_ids(conn, (day[1] for day in content.values()))
+    rows = []
+    for date_str, day in content.items():
+        old = base.get(date_str)
+        changed = 0
+        for i, bit in enumerate(FIELD_BITS):
+            if old is None or old[i] != day[i]:
+                changed |= bit
+        if changed:
+            # 変わった列だけ値を入れる
+            rows.append((
+                snapshot_id, date_str, changed,
+                day[0] if changed & FIELD_WEATHER_CODE else None,
+                text_ids.get(day[1]) if changed & FIELD_WEATHER else None,
+                day[2] if changed & FIELD_TEMP_MIN else None,
+                day[3] if changed & FIELD_TEMP_MAX else None,
+            ))
+    for date_str in base.keys() - content.keys():
+        rows.append((snapshot_id, date_str, 0, None, None, None, None))
+
+    conn.executemany("""
+        INSERT INTO forecasts
+        (snapshot_id, forecast_date, changed, weather_code, weather_id, temp_min, temp_max)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+
+def _store_snapshot(conn, content, content_hash, base_id, base):
+    """スナップショットを保存（base_id があれば base との差分だけ保存）"""
+    depth = _delta_depth(conn, base_id)
+    if depth is None:
+        base_id, base, depth = None, {}, 0
+
+    snapshot_id = conn.execute("""
+        INSERT INTO snapshots (payload_hash, base_id, depth) VALUES (?, ?, ?)
+    """, (content_hash, base_id, depth)).lastrowid
+    _write_snapshot_rows(conn, snapshot_id, content, base)
+    return snapshot_id
+
+
+def rebase_snapshot(conn, snapshot_id, base_id):
+    """スナップショットの差分の元を base_id に付け替える（内容は変わらない）
+
+    間の取得を削除したあと、鎖を短くして古い差分を回収できるようにするために使う。
+    base_id の鎖に snapshot_id 自身が含まれる場合は循環するので何もしない。
+    """
+    if base_id is not None:
+        in_chain = conn.execute("""
+            WITH RECURSIVE chain(snapshot_id, base_id) AS (
+                SELECT snapshot_id, base_id FROM snapshots WHERE snapshot_id = ?
+                UNION ALL
+                SELECT s.snapshot_id, s.base_id
+                FROM snapshots s JOIN chain c ON s.snapshot_id = c.base_id
+            )
+            SELECT 1 FROM chain WHERE snapshot_id = ?
+        """, (base_id, snapshot_id)).fetchone()
+        if in_chain:
+            return False
+
+    content = load_snapshot(conn, snapshot_id)
+    depth = _delta_depth(conn, base_id)
+    if depth is None:
+        base_id, depth = None, 0
+    base = load_snapshot(conn, base_id) if base_id is not None else {}
+
+    conn.execute("DELETE FROM forecasts WHERE snapshot_id = ?", (snapshot_id,))
+    conn.execute(
+        "UPDATE snapshots SET base_id = ?, depth = ? WHERE snapshot_id = ?",
+        (base_id, depth, snapshot_id),
+    )
+    _write_snapshot_rows(conn, snapshot_id, content, base)
+    _update_descendant_depths(conn, snapshot_id)
+    return True
+
+
+def _update_descendant_depths(conn, snapshot_id):
+    """snapshot_id に重なっている差分の depth を付け直す
+
+    付け替えで段数が MAX_DELTA_DEPTH を超えた差分は、全日分で保存し直す（その先も付け直す）。
+    """
+    rows = conn.execute("""
+        WITH RECURSIVE tree(snapshot_id, depth) AS (
+            SELECT snapshot_id, depth FROM snapshots WHERE snapshot_id = ?
+            UNION ALL
+            SELECT s.snapshot_id, t.depth + 1
+            FROM snapshots s JOIN tree t ON s.base_id = t.snapshot_id
+        )
+        SELECT snapshot_id, depth FROM tree WHERE snapshot_id != ?
+    """, (snapshot_id, snapshot_id)).fetchall()
+    conn.executemany(
+        "UPDATE snapshots SET depth = ? WHERE snapshot_id = ?",
+        [(depth, descendant_id) for descendant_id, depth in rows],
+    )
+    for descendant_id, depth in rows:
+        if depth == MAX_DELTA_DEPTH + 1:
+            rebase_snapshot(conn, descendant_id, None)
+
+
+def collect_garbage(conn):
+    """どの取得からも辿れないスナップショットと天気文字列を削除
+
+    戻り値は削除したスナップショットの数。
+    """
+    count_sql = "SELECT COUNT(*) FROM snapshots"
+    before = conn.execute(count_sql).fetchone()[0]
+    conn.execute("""
+        WITH RECURSIVE live(snapshot_id) AS (
+            SELECT snapshot_id FROM fetch_runs WHERE snapshot_id IS NOT NULL
+            UNION
+            SELECT s.base_id FROM snapshots s
+            JOIN live l ON s.snapshot_id = l.snapshot_id
+            WHERE s.base_id IS NOT NULL
+        )
+        DELETE FROM snapshots WHERE snapshot_id NOT IN (SELECT snapshot_id FROM live)
+    """)
+    # forecasts の行は ON DELETE CASCADE で消える
+    removed = before - conn.execute(count_sql).fetchone()[0]
+    conn.execute("""
+        DELETE FROM weather_texts WHERE text_id NOT IN (
+            SELECT weather_id FROM forecasts WHERE weather_id IS NOT NULL
+        )
+    """)
+    return removed
+
+
+# save_content のたびに呼ぶ関数（add_save_hook で登録）
+_save_hooks = []
+
+
+def add_save_hook(hook):
+    """予報を保存するたびに hook(conn, area_code, fetched_at, snapshot_id, content, previous) を呼ぶ
+
+    previous はその地域のそれまでの最新の取得の内容（なければ空の辞書）。
+    保存と同じトランザクション内で呼ぶので、例外を出すと保存ごと取り消される。
+    """
+    if hook not in _save_hooks:
+        _save_hooks.append(hook)
+
+
+@contextmanager
+def suspend_save_hooks():
+    """with の間、このスレッドの保存ではフックを呼ばない
+
+    過去の取得をまとめて書き直すときなど、フックの処理（集計表の更新）を後で一度に行う場合に使う。
+    """
+    previous = getattr(_local, "hooks_suspended", False)
+    _local.hooks_suspended = True
+    try:
+        yield
+    finally:
+        _local.hooks_suspended = previous
+
+
+def _latest_snapshot_id(conn, area_code):
+    """地域の最新の取得が参照しているスナップショット"""
+    row = conn.execute("""
+        SELECT snapshot_id FROM fetch_runs
+        WHERE area_code = ?
+        ORDER BY fetched_at DESC
+        LIMIT 1
+    """, (area_code,)).fetchone()
+    return row[0] if row else None
+
+
+def _resolve_snapshot(conn, content, base_id, base=None):
+    """内容に対応するスナップショットを取得（なければ base_id との差分で保存）
+
+    base に base_id の内容を渡すと読み直さない。
+    戻り値は (snapshot_id, 前回と比べた日単位の WriteStats)。
+    """
+    if base is None:
+        base = load_snapshot(conn, base_id) if base_id is not None else {}
+    content_hash = _content_hash(content)
+    row = conn.execute(
+        "SELECT snapshot_id FROM snapshots WHERE payload_hash = ?", (content_hash,)
+    ).fetchone()
+    if row:
+        snapshot_id = row[0]
+    else:
+        snapshot_id = _store_snapshot(conn, content, content_hash, base_id, base)
+
+    inserted = len(content.keys() - base.keys())
+    updated = sum(
+        1 for date_str, day in content.items()
+        if date_str in base and base[date_str] != day
+    )
+    return snapshot_id, WriteStats(inserted, updated, len(content) - inserted - updated)
+
+
+def save_content(conn, area_code, area_name, content, fetched_at):
+    """1地域分の予報を書き込む（トランザクション内で呼ぶ）
+
+    content は load_snapshot() と同じ形の辞書。前回と同じ内容なら取得記録（fetch_runs の1行）だけを追加する。
+    """
+    base_id = _latest_snapshot_id(conn, area_code)
+    base = load_snapshot(conn, base_id) if base_id is not None else {}
+    snapshot_id, stats = _resolve_snapshot(conn, content, base_id, base)
+
+    run = conn.execute("""
+        SELECT run_id FROM fetch_runs WHERE area_code = ? AND fetched_at = ?
+    """, (area_code, fetched_at)).fetchone()
+    if run is None:
+        conn.execute("""
+            INSERT INTO fetch_runs (area_code, area_name, fetched_at, fetch_date, snapshot_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (area_code, area_name, fetched_at, fetched_at[:10], snapshot_id))
+    else:
+        conn.execute("""
+            UPDATE fetch_runs SET area_name = ?, snapshot_id = ? WHERE run_id = ?
+        """, (area_name, snapshot_id, run[0]))
+    _pending_invalidations(conn).add((area_code, fetched_at[:10]))
+    if not getattr(_local, "hooks_suspended", False):
+        for hook in _save_hooks:
+            hook(conn, area_code, fetched_at, snapshot_id, content, base)
+    return stats
+
+
+def _save_forecast(conn, area_code, area_name, weather_data, fetched_at):
+    """parse結果を1地域分書き込む（トランザクション内で呼ぶ）"""
+    return save_content(conn, area_code, area_name, _snapshot_content(weather_data), fetched_at)
+
+
+def save_forecasts_bulk(forecasts, verbose=True):
+    """複数地域の予報を1トランザクションでまとめて保存
+
+    forecasts は (area_code, area_name, weather_data, fetched_at) のイテラブル。
+    verbose=False なら保存した件数を表示しない。
+    """
+    stats = WriteStats()
+    count = 0
+    with transaction() as conn:
+        for area_code, area_name, weather_data, fetched_at in forecasts:
+            stats += _save_forecast(conn, area_code, area_name, weather_data, fetched_at)
+            count += 1
+    if verbose:
+        print(f"{count}地域の予報を保存 ({stats})")
+    return stats
+
+
+def save_forecast_to_db(area_code, area_name, weather_data, fetched_at):
+    """天気予報データをDBに保存"""
+    with transaction() as conn:
+        stats = _save_forecast(conn, area_code, area_name, weather_data, fetched_at)
+    print(f"{area_name}の予報を保存 ({stats})")
+    return stats
+
+
+def _find_run(conn, area_code, target_date=None):
+    """表示対象の取得（snapshot_id, fetched_at）を探す"""
+    if target_date:
+        # その日の最後の取得（idx_fetch_runs_area_fetch_date のシーク）
+        return conn.execute("""
+            SELECT snapshot_id, fetched_at FROM fetch_runs
+            WHERE area_code = ? AND fetch_date = ?
+            ORDER BY fetched_at DESC
+            LIMIT 1
+        """, (area_code, target_date)).fetchone()
+    # 最新の取得（UNIQUE(area_code, fetched_at) のシーク）
+    return conn.execute("""
+        SELECT snapshot_id, fetched_at FROM fetch_runs
+        WHERE area_code = ?
+        ORDER BY fetched_at DESC
+        LIMIT 1
+    """, (area_code,)).fetchone()
+
+
+def get_forecasts_from_db(area_code, target_date=None):
+    """DBから天気予報を取得
+
+    target_date を指定するとその日に取得した分（同じ日に複数回取得していれば最後の分）、
+    省略すると最新の取得分を返す。
+    各行は (日付, 天気コード, 天気, 最低気温, 最高気温, 取得日時)。
+    """
+    key = (DB_PATH, "forecasts", area_code, target_date or "latest")
+    cached = _query_cache.get(key)
+    if cached is not None:
+        return list(cached)
+    token = _query_cache.token()
+
+    conn = get_connection()
+    run = _find_run(conn, area_code, target_date)
+    if run is None or run[0] is None:
+        rows = []
+    else:
+        snapshot_id, fetched_at = run
+        content = load_snapshot(conn, snapshot_id)
+        rows = [
+            (date_str, weather_code, weather, temp_min, temp_max, fetched_at)
+            for date_str, (weather_code, weather, temp_min, temp_max) in sorted(content.items())
+        ]
+    _query_cache.put(key, tuple(rows), token)
+    return rows
+
+
+def get_available_dates(area_code):
+    """過去に取得した予報の日付リストを取得"""
+    key = (DB_PATH, "dates", area_code)
+    cached = _query_cache.get(key)
+    if cached is not None:
+        return list(cached)
+    token = _query_cache.token()
+
+    conn = get_connection()
+
+    cursor = conn.execute("""
+        SELECT DISTINCT fetch_date
+        FROM fetch_runs
+        WHERE area_code = ?
+        ORDER BY fetch_date DESC
+        LIMIT 30
+    """, (area_code,))
+
+    dates = [row[0] for row in cursor.fetchall()]
+    _query_cache.put(key, tuple(dates), token)
+    return dates
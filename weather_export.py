@@ -0,0 +1,336 @@
+"""予報履歴を列形式のファイルに書き出す（pandas / NumPy での分析用）
+
+SELECT * で全件をメモリに読むかわりに、取得を1件ずつ復元して chunk_rows 行ごとに書き出すので、
+履歴が何年分あってもメモリの使用量は変わらない。書き出す形式は次のどちらか。
+
+- Arrow IPC ファイル（.arrow、pyarrow があるとき）: 地域と天気は辞書型の列
+- NumPy の .npz（numpy があるとき）: 地域と天気は辞書（area_codes, weather_texts）の番号の列
+  （-1 = なし）。圧縮しない（ZIP_STORED）ので、load_export() でそのままメモリマップできる
+
+Parquet はメモリマップしても展開が必要なので、ゼロコピーで読める Arrow IPC を使う。
+列は area, fetched_at（日本時間の日時をそのまま秒にした値）, forecast_date, weather_code,
+weather, temp_min, temp_max。
+
+使い方:
+    python weather_export.py forecasts.arrow
+    python weather_export.py forecasts.npz --area 130000 --start 2026-01-01 --end 2026-04-01
+"""
+import argparse
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass
+from datetime import date, datetime
+
+import weather_db
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401  pa.ipc を使えるようにする
+except ImportError:
+    pa = None
+
+# 1回に書き出す行数
+CHUNK_ROWS = 65536
+
+# 日付は 1970-01-01 からの日数で保存する
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_EPOCH = datetime(1970, 1, 1)
+
+# .npz の列（名前, 型）。番号の列の -1 と気温の NaN は「なし」
+NPZ_COLUMNS = (
+    ("area", "int32"),
+    ("fetched_at", "datetime64[s]"),
+    ("forecast_date", "datetime64[D]"),
+    ("weather_code", "int16"),
+    ("weather", "int32"),
+    ("temp_min", "float32"),
+    ("temp_max", "float32"),
+)
+
+
+@dataclass
+class ExportStats:
+    """書き出しの結果"""
+    path: str
+    format: str
+    runs: int = 0
+    rows: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+
+    def __str__(self):
+        return (
+            f"{self.path} ({self.format}): 取得{self.runs}件, {self.rows}行, "
+            f"{self.bytes:,}バイト, {self.elapsed:.1f}秒"
+        )
+
+
+def _run_filter(area_codes=None, start=None, end=None):
+    """fetch_runs の絞り込み条件（start <= fetched_at < end）"""
+    conditions, params = [], []
+    if area_codes:
+        conditions.append(f"area_code IN ({', '.join('?' * len(area_codes))})")
+        params.extend(area_codes)
+    if start:
+        conditions.append("fetched_at >= ?")
+        params.append(start)
+    if end:
+        conditions.append("fetched_at < ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+
+def _dictionaries(conn, where, params):
+    """地域コード・地域名・天気の辞書（すべてのチャンクで同じ辞書を使う）"""
+    areas = conn.execute(f"""
+        SELECT area_code, MAX(area_name) FROM fetch_runs {where}
+        GROUP BY area_code ORDER BY area_code
+    """, params).fetchall()
+    texts = [row[0] for row in conn.execute("SELECT text FROM weather_texts ORDER BY text_id")]
+    return [code for code, _ in areas], [name for _, name in areas], texts
+
+
+def iter_chunks(conn, area_index, text_index, where="", params=(), chunk_rows=CHUNK_ROWS):
+    """取得を地域・日時の順に復元して、(列名 -> 値のリスト, 含まれる取得の数) を chunk_rows 行ごとに返す
+
+    area_index, text_index は地域コード・天気 -> 辞書の番号。
+    日時は秒、日付は日数にしてあり、なしは None。
+    """
+    runs = conn.execute(f"""
+        SELECT area_code, fetched_at, snapshot_id FROM fetch_runs {where}
+        ORDER BY area_code, fetched_at
+    """, params)
+    chunk = {name: [] for name, _ in NPZ_COLUMNS}
+    chunk_runs = 0
+    snapshot_id, snapshot, content = None, {}, []
+    for area_code, fetched_at, run_snapshot_id in runs:
+        if run_snapshot_id is None:
+            continue
+        # 内容が変わっていない取得は同じスナップショットを指すので復元し直さない。
+        # 変わっていれば直前の取得との差分だけを読む
+        if run_snapshot_id != snapshot_id:
+            snapshot = weather_db.load_snapshot_after(conn, run_snapshot_id, snapshot_id, snapshot)
+            snapshot_id = run_snapshot_id
+            content = [
+                (date.fromisoformat(date_str).toordinal() - _EPOCH_ORDINAL, day)
+                for date_str, day in sorted(snapshot.items())
+            ]
+        seconds = int((datetime.fromisoformat(fetched_at) - _EPOCH).total_seconds())
+        area = area_index[area_code]
+        for days, (weather_code, weather, temp_min, temp_max) in content:
+            chunk["area"].append(area)
+            chunk["fetched_at"].append(seconds)
+            chunk["forecast_date"].append(days)
+            chunk["weather_code"].append(weather_code)
+            chunk["weather"].append(text_index.get(weather))
+            chunk["temp_min"].append(temp_min)
+            chunk["temp_max"].append(temp_max)
+        chunk_runs += 1
+        if len(chunk["area"]) >= chunk_rows:
+            yield chunk, chunk_runs
+            chunk = {name: [] for name, _ in NPZ_COLUMNS}
+            chunk_runs = 0
+    if chunk_runs:
+        yield chunk, chunk_runs
+
+
+class _ArrowWriter:
+    """Arrow IPC ファイルに書き出す（辞書はすべてのバッチで同じ）"""
+
+    def __init__(self, path, area_codes, area_names, texts):
+        self.areas = pa.array(area_codes, pa.string())
+        self.texts = pa.array(texts, pa.string())
+        self.schema = pa.schema([
+            ("area", pa.dictionary(pa.int32(), pa.string())),
+            ("fetched_at", pa.timestamp("s")),
+            ("forecast_date", pa.date32()),
+            ("weather_code", pa.int16()),
+            ("weather", pa.dictionary(pa.int32(), pa.string())),
+            ("temp_min", pa.float32()),
+            ("temp_max", pa.float32()),
+        ], metadata={"area_names": "\t".join(area_names)})
+        self._writer = pa.ipc.new_file(path, self.schema)
+
+    def write(self, chunk):
+        batch = pa.record_batch([
+            pa.DictionaryArray.from_arrays(pa.array(chunk["area"], pa.int32()), self.areas),
+            pa.array(chunk["fetched_at"], pa.timestamp("s")),
+            pa.array(chunk["forecast_date"], pa.date32()),
+            pa.array(chunk["weather_code"], pa.int16()),
+            pa.DictionaryArray.from_arrays(pa.array(chunk["weather"], pa.int32()), self.texts),
+            pa.array(chunk["temp_min"], pa.float32()),
+            pa.array(chunk["temp_max"], pa.float32()),
+        ], schema=self.schema)
+        self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+
+
+class _NpzWriter:
+    """.npz に書き出す（列ごとの一時ファイルに追記し、最後に無圧縮のZIPにまとめる）"""
+
+    def __init__(self, path, area_codes, area_names, texts):
+        self.path = path
+        self.dictionaries = {
+            "area_codes": np.array(area_codes, dtype=str),
+            "area_names": np.array(area_names, dtype=str),
+            "weather_texts": np.array(texts, dtype=str),
+        }
+        self.columns = {name: (np.dtype(dtype), tempfile.TemporaryFile()) for name, dtype in NPZ_COLUMNS}
+        self.rows = 0
+
+    def write(self, chunk):
+        for name, (dtype, tmp) in self.columns.items():
+            values = chunk[name]
+            if dtype.kind == "f":
+                array = np.array([np.nan if v is None else v for v in values], dtype=dtype)
+            elif dtype.kind == "M":
+                array = np.array(values, dtype="int64").view(dtype)
+            else:
+                array = np.array([-1 if v is None else v for v in values], dtype=dtype)
+            array.tofile(tmp)
+        self.rows += len(chunk["area"])
+
+    def close(self):
+        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for name, (dtype, tmp) in self.columns.items():
+                tmp.seek(0)
+                with zf.open(f"{name}.npy", "w", force_zip64=True) as out:
+                    np.lib.format.write_array_header_1_0(out, {
+                        "descr": np.lib.format.dtype_to_descr(dtype),
+                        "fortran_order": False,
+                        "shape": (self.rows,),
+                    })
+                    shutil.copyfileobj(tmp, out, 1024 * 1024)
+                tmp.close()
+            for name, array in self.dictionaries.items():
+                with zf.open(f"{name}.npy", "w", force_zip64=True) as out:
+                    np.lib.format.write_array(out, array, allow_pickle=False)
+
+
+def available_formats():
+    """使える形式（pyarrow, numpy が入っていれば "arrow", "npz"）"""
+    return [name for name, module in (("arrow", pa), ("npz", np)) if module is not None]
+
+
+def _format_for(path, fmt=None):
+    if fmt is None:
+        fmt = "npz" if path.endswith(".npz") else "arrow"
+    if fmt not in available_formats():
+        module = "pyarrow" if fmt == "arrow" else "numpy"
+        raise RuntimeError(f"{fmt} 形式で書き出すには {module} をインストールしてください")
+    return fmt
+
+
+def export_forecasts(path, area_codes=None, start=None, end=None, fmt=None,
+                     chunk_rows=CHUNK_ROWS, db_path=None):
+    """予報履歴をファイルに書き出す（fmt は "arrow" か "npz"、省略すると拡張子で決める）
+
+    start, end は取得日時で絞り込む（start <= fetched_at < end、"2026-01-01" のような日付でもよい）。
+    """
+    fmt = _format_for(path, fmt)
+    started = time.perf_counter()
+    stats = ExportStats(path, fmt)
+    conn = weather_db.get_connection(db_path)
+    where, params = _run_filter(area_codes, start, end)
+
+    # 読み取りトランザクション内で読む（書き出し中に保存された取得は含めない）
+    conn.execute("BEGIN")
+    try:
+        area_codes, area_names, texts = _dictionaries(conn, where, params)
+        writer_class = _ArrowWriter if fmt == "arrow" else _NpzWriter
+        writer = writer_class(path, area_codes, area_names, texts)
+        area_index = {code: i for i, code in enumerate(area_codes)}
+        text_index = {text: i for i, text in enumerate(texts)}
+        try:
+            for chunk, runs in iter_chunks(conn, area_index, text_index, where, params, chunk_rows):
+                writer.write(chunk)
+                stats.runs += runs
+                stats.rows += len(chunk["area"])
+        finally:
+            writer.close()
+    finally:
+        conn.execute("ROLLBACK")
+
+    stats.bytes = os.path.getsize(path)
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def _npz_memmap(path):
+    """無圧縮の .npz の各配列をメモリマップで開く"""
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"圧縮された配列はメモリマップできません: {info.filename}")
+            # ローカルファイルヘッダー（30バイト + 名前 + 拡張フィールド）の後ろに .npy がある
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len(".npy")]
+            if not all(shape):
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(
+                    path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                    order="F" if fortran_order else "C",
+                )
+    return arrays
+
+
+def load_export(path):
+    """書き出したファイルをメモリマップで開く（データはコピーしない）
+
+    .arrow は pyarrow.Table、.npz は 名前 -> numpy配列 の辞書を返す。
+    """
+    if path.endswith(".npz"):
+        if np is None:
+            raise RuntimeError(".npz を読むには numpy をインストールしてください")
+        return _npz_memmap(path)
+    if pa is None:
+        raise RuntimeError(".arrow を読むには pyarrow をインストールしてください")
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="予報履歴を列形式のファイルに書き出す")
+    parser.add_argument("output", help="書き出すファイル（.arrow または .npz）")
+    parser.add_argument("--area", action="append", help="地域コード（複数指定可、省略時は全地域）")
+    parser.add_argument("--start", help="この日時以降の取得（例: 2026-01-01）")
+    parser.add_argument("--end", help="この日時より前の取得")
+    parser.add_argument("--format", choices=("arrow", "npz"), help="形式（省略時は拡張子で決める）")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    try:
+        fmt = _format_for(args.output, args.format)
+    except RuntimeError as e:
+        parser.error(str(e))
+    weather_db.init_database()
+    stats = export_forecasts(
+        args.output, args.area, args.start, args.end, fmt, args.chunk_rows
+    )
+    print(f"書き出し完了: {stats}")
+    weather_db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""1つのプロセスで共有する地域データと予報（FletのWebモード用）
+
+Webモードではブラウザのセッションごとに main(page) が動くので、そのままだと
+セッションごとに area.json を取り直し、同じ地域の予報も別々に取得してしまう。
+WeatherHub はプロセスに1つだけ作り、全セッションで次のものを共有する。
+
+- 気象庁APIクライアント（接続プールとディスクキャッシュ）とワーカースレッド
+- 地域の階層と検索の索引（更新されたら登録済みのセッションに通知）
+- 直近に取得した予報（recent_ttl 秒以内なら取得も保存もしない）
+- 実行中の取得（同じ地域を同時に選んだセッションは、1回の取得・保存の結果を待つ）
+
+UIを持たないので、デスクトップ版（セッション1つ）でも同じように使える。
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+import weather_analytics
+from area_index import AreaIndex
+from jma_client import JmaClient
+from weather_db import init_database, load_area_hierarchy, save_area_json
+from weather_service import (
+    EXCLUDED_AREA_CODES,
+    ForecastLoader,
+    fetch_and_store,
+    load_area_forecast,
+    sync_all_offices,
+)
+
+# 直近の予報を使い回す時間（秒）と保持する地域数
+RECENT_TTL = 60
+RECENT_LIMIT = 128
+# 地域データを気象庁APIに確かめ直す間隔（秒）
+AREA_CHECK_INTERVAL = 600
+
+
+class SingleFlight:
+    """同じキーの処理が実行中なら新しく実行せず、その結果（例外も）を待って返す"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, func, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.executed += 1
+            else:
+                self.shared += 1
+        if leader:
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                # KeyboardInterrupt なども待っている側に伝える（解決しないと永久に待たせる）
+                future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        return future.result()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+@dataclass
+class HubStats:
+    """共有層の統計（実行は実際に行った取得・更新の回数、相乗りは実行中の処理の結果を待った回数）"""
+    executed: int = 0
+    shared: int = 0
+    recent_hits: int = 0
+    sessions: int = 0
+
+    def __str__(self):
+        return (
+            f"実行{self.executed}件, 相乗り{self.shared}件, "
+            f"直近の予報を使用{self.recent_hits}件, 接続中のセッション{self.sessions}"
+        )
+
+
+class WeatherHub:
+    """全セッションで共有する地域データ・予報・取得処理"""
+
+    def __init__(self, client=None, recent_ttl=RECENT_TTL, max_workers=8,
+                 area_check_interval=AREA_CHECK_INTERVAL):
+        self.client = client or JmaClient()
+        self.recent_ttl = recent_ttl
+        self.area_check_interval = area_check_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="forecast")
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()  # 地域コード -> (取得した時刻, ForecastResult)
+        self._recent_hits = 0
+        self._areas = None  # (centers, offices, AreaIndex)
+        self._areas_checked = None
+        self._listeners = []
+
+    # --- 地域データ ---
+
+    def areas(self):
+        """(centers, offices, 検索の索引)。最初の1回だけDB（なければ気象庁API）から読み込む"""
+        if self._areas is None:
+            self._flight.do("areas.load", self._load_areas)
+        return self._areas
+
+    def _load_areas(self):
+        if self._areas is not None:
+            return
+        centers, offices = load_area_hierarchy()
+        if not centers:
+            # 初回起動：保存済みの area.json、なければ気象庁APIから取得
+            area_response = self.client.get_cached_area_json() or self.client.get_area_json()
+            area_data = area_response.json()
+            centers = area_data.get("centers", {})
+            offices = area_data.get("offices", {})
+            save_area_json(area_data)
+        self._areas = (centers, offices, AreaIndex.from_db(excluded_offices=EXCLUDED_AREA_CODES))
+
+    def refresh_areas(self):
+        """気象庁APIから地域データを更新し、変わっていれば登録済みのセッションに通知
+
+        area_check_interval 秒以内に確かめていれば何もしない（セッションが開くたびには取得しない）。
+        """
+        return self._flight.do("areas.refresh", self._refresh_areas)
+
+    def _refresh_areas(self):
+        now = time.monotonic()
+        if self._areas_checked is not None and now - self._areas_checked < self.area_check_interval:
+            return False
+        try:
+            area_data = self.client.get_area_json().json()
+            centers = area_data.get("centers", {})
+            offices = area_data.get("offices", {})
+            stats = save_area_json(area_data)
+        except Exception as e:
+            print(f"地域データの更新に失敗: {e}")
+            return False
+        self._areas_checked = now
+        if not stats.changed and self._areas is not None:
+            return False
+
+        self._areas = (centers, offices, AreaIndex.from_db(excluded_offices=EXCLUDED_AREA_CODES))
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(*self._areas)
+            except Exception as e:
+                # 閉じかけのセッションなど。ほかのセッションへの通知は続ける
+                print(f"地域データの通知に失敗: {e}")
+        return True
+
+    def subscribe(self, listener):
+        """地域データが変わったときに listener(centers, offices, index) を呼ぶ
+
+        登録を解除する関数を返す（セッションを閉じるときに呼ぶ）。
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+        def unsubscribe():
+            with self._lock:
+                if listener in self._listeners:
+                    self._listeners.remove(listener)
+        return unsubscribe
+
+    # --- 予報 ---
+
+    def load_forecast(self, area_code, area_name):
+        """予報を取得→保存→読み込み（直近の結果があれば使い、同時の取得は1回にまとめる）"""
+        result = self._recent_result(area_code)
+        if result is not None:
+            return result
+        return self._flight.do(("forecast", area_code), self._load_forecast, area_code, area_name)
+
+    def _load_forecast(self, area_code, area_name):
+        # 待っている間に別のセッションが取得を終えていたらその結果を使う
+        result = self._recent_result(area_code)
+        if result is not None:
+            return result
+        result = load_area_forecast(self.client, area_code, area_name, refresh=self._refresh_office)
+        if result.source == "api" and self.recent_ttl > 0:
+            with self._lock:
+                self._recent[area_code] = (time.monotonic(), result)
+                self._recent.move_to_end(area_code)
+                while len(self._recent) > RECENT_LIMIT:
+                    self._recent.popitem(last=False)
+        return result
+
+    def _refresh_office(self, office_code, office_name):
+        """オフィスの予報を取得・保存（同じオフィスの細分区域が同時に選ばれても取得は1回）"""
+        return self._flight.do(("fetch", office_code), fetch_and_store, self.client, office_code, office_name)
+
+    def _recent_result(self, area_code):
+        with self._lock:
+            entry = self._recent.get(area_code)
+            if entry is None:
+                return None
+            loaded_at, result = entry
+            if time.monotonic() - loaded_at >= self.recent_ttl:
+                del self._recent[area_code]
+                return None
+            self._recent_hits += 1
+            return result
+
+    def limit_ttl(self, ttl):
+        """予報を使い回す期間を ttl 秒までにする（直近の予報と JmaClient のキャッシュの両方）"""
+        self.recent_ttl = min(self.recent_ttl, ttl)
+        self.client.forecast_max_age = min(self.client.forecast_max_age, ttl)
+
+    def forget_recent(self):
+        """直近の予報を捨てる（一括同期などでDBの内容が変わったとき）"""
+        with self._lock:
+            self._recent.clear()
+
+    def loader(self):
+        """セッション用の ForecastLoader（ワーカースレッドと取得処理は共有）"""
+        return ForecastLoader(self.client, load=self.load_forecast, executor=self.executor)
+
+    def sync_all(self, on_progress=None):
+        """全地域の一括同期（実行中なら新しく始めず、その結果を待つ）
+
+        進捗は最初に始めたセッションにだけ通知する。
+        """
+        return self._flight.do("sync", self._sync_all, on_progress)
+
+    def _sync_all(self, on_progress):
+        offices = self.areas()[1]
+        try:
+            return sync_all_offices(self.client, offices, on_progress=on_progress)
+        finally:
+            self.forget_recent()
+
+    def stats(self):
+        with self._lock:
+            return HubStats(
+                executed=self._flight.executed,
+                shared=self._flight.shared,
+                recent_hits=self._recent_hits,
+                sessions=len(self._listeners),
+            )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    """プロセスで1つの WeatherHub（最初に呼ばれたときにDBを初期化して作る）"""
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            init_database()
+            weather_analytics.register()
+            _hub = WeatherHub()
+        return _hub
@@ -0,0 +1,225 @@
+"""気象庁APIの生のレスポンスの保存（圧縮・重複排除）
+
+weather.db には parse_forecast_data などで解析した結果しか残らないので、解析の不具合を直したり
+項目を増やしたりしても過去の取得には反映できない。そこで予報のJSONをそのまま別のDB
+（weather.db なら weather_raw.db）に圧縮して保存しておき、weather_backfill.py で解析し直す。
+
+- payloads: 本文（SHA-256 で重複排除し、zstd があれば zstd、なければ zlib で圧縮）
+- responses: 地域コード・取得日時ごとの取得（どの本文だったか）
+
+304 で前回と同じ本文が返ったときは responses の1行だけが増える。
+
+使い方:
+    python weather_raw.py                  # 保存件数と圧縮率を表示
+"""
+import argparse
+import hashlib
+import os
+import threading
+import zlib
+from collections import namedtuple
+from dataclasses import dataclass
+
+import weather_db
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 生のレスポンスを保存するか
+ENABLED = True
+# 保存先のDB。None なら weather_db.DB_PATH と同じ場所に「<名前>_raw.db」で作る
+RAW_DB_PATH = None
+
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 10
+
+# 保存した取得（raw_size は圧縮前の本文の大きさ）
+ArchivedResponse = namedtuple(
+    "ArchivedResponse", "area_code fetched_at area_name payload_id raw_size"
+)
+
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def raw_db_path():
+    """生のレスポンスを保存するDBのパス"""
+    if RAW_DB_PATH:
+        return RAW_DB_PATH
+    base, ext = os.path.splitext(weather_db.DB_PATH)
+    return f"{base}_raw{ext or '.db'}"
+
+
+def default_codec():
+    return "zstd" if zstandard is not None else "zlib"
+
+
+def compress(body, codec=None):
+    """(codec, 圧縮した本文)"""
+    codec = codec or default_codec()
+    if codec == "zstd":
+        return codec, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return "zlib", zlib.compress(body, ZLIB_LEVEL)
+
+
+def decompress(codec, data):
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd で圧縮された本文を読むには zstandard が必要です（pip install zstandard）")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"不明な圧縮形式: {codec}")
+
+
+def _ensure_schema(db_path):
+    """初めて使うDBならテーブルを作成"""
+    if db_path in _schema_ready:
+        return
+    with _schema_lock:
+        if db_path in _schema_ready:
+            return
+        with weather_db.transaction(db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS payloads (
+                    payload_id INTEGER PRIMARY KEY,
+                    sha256 BLOB NOT NULL UNIQUE,
+                    codec TEXT NOT NULL,
+                    raw_size INTEGER NOT NULL,
+                    data BLOB NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    area_code TEXT NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    area_name TEXT,
+                    payload_id INTEGER NOT NULL REFERENCES payloads(payload_id),
+                    PRIMARY KEY (area_code, fetched_at)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_fetched_at ON responses(fetched_at)")
+        _schema_ready.add(db_path)
+
+
+def connection(db_path=None):
+    """生のレスポンスのDBへの接続（スレッドごと、テーブルがなければ作る）"""
+    db_path = db_path or raw_db_path()
+    _ensure_schema(db_path)
+    return weather_db.get_connection(db_path)
+
+
+def store_response(area_code, area_name, fetched_at, body, db_path=None):
+    """取得した本文を保存し、payload_id を返す（ENABLED でなければ何もせず None）
+
+    同じ本文が保存済みなら圧縮も保存もせず、取得の記録だけを追加する。
+    """
+    if not ENABLED:
+        return None
+    db_path = db_path or raw_db_path()
+    conn = connection(db_path)
+    digest = hashlib.sha256(body).digest()
+    row = conn.execute("SELECT payload_id FROM payloads WHERE sha256 = ?", (digest,)).fetchone()
+    # 圧縮は書き込みロックの外で行う
+    compressed = compress(body) if row is None else None
+
+    with weather_db.transaction(db_path) as conn:
+        if compressed is not None:
+            conn.execute("""
+                INSERT INTO payloads (sha256, codec, raw_size, data) VALUES (?, ?, ?, ?)
+                ON CONFLICT(sha256) DO NOTHING
+            """, (digest, compressed[0], len(body), compressed[1]))
+            row = conn.execute("SELECT payload_id FROM payloads WHERE sha256 = ?", (digest,)).fetchone()
+        conn.execute("""
+            INSERT INTO responses (area_code, fetched_at, area_name, payload_id) VALUES (?, ?, ?, ?)
+            ON CONFLICT(area_code, fetched_at) DO UPDATE SET
+                area_name = excluded.area_name,
+                payload_id = excluded.payload_id
+        """, (area_code, fetched_at, area_name, row[0]))
+    return row[0]
+
+
+def load_payload(payload_id, db_path=None):
+    """保存した本文（圧縮前のバイト列）"""
+    row = connection(db_path).execute(
+        "SELECT codec, data FROM payloads WHERE payload_id = ?", (payload_id,)
+    ).fetchone()
+    if row is None:
+        raise KeyError(payload_id)
+    return decompress(*row)
+
+
+def load_response(area_code, fetched_at, db_path=None):
+    """地域コード・取得日時の本文（保存していなければ None）"""
+    row = connection(db_path).execute("""
+        SELECT payload_id FROM responses WHERE area_code = ? AND fetched_at = ?
+    """, (area_code, fetched_at)).fetchone()
+    return load_payload(row[0], db_path) if row else None
+
+
+def list_responses(since=None, until=None, db_path=None):
+    """保存した取得の一覧（取得日時の古い順、since〜until は取得日時か日付で絞り込み）"""
+    sql = """
+        SELECT r.area_code, r.fetched_at, r.area_name, r.payload_id, p.raw_size
+        FROM responses r
+        JOIN payloads p ON p.payload_id = r.payload_id
+        WHERE 1 = 1
+    """
+    params = []
+    if since:
+        sql += " AND r.fetched_at >= ?"
+        params.append(since)
+    if until:
+        # 日付だけ指定したときはその日の終わりまで含める
+        sql += " AND r.fetched_at <= ?"
+        params.append(until + "\uffff")
+    cursor = connection(db_path).execute(sql + " ORDER BY r.fetched_at, r.area_code", params)
+    return [ArchivedResponse(*row) for row in cursor]
+
+
+@dataclass
+class RawStats:
+    """保存状況（raw_bytes は全取得の本文の合計、stored_bytes は重複排除・圧縮後の大きさ）"""
+    responses: int = 0
+    payloads: int = 0
+    raw_bytes: int = 0
+    stored_bytes: int = 0
+
+    def __str__(self):
+        ratio = self.raw_bytes / self.stored_bytes if self.stored_bytes else 0.0
+        return (
+            f"取得{self.responses}件, 本文{self.payloads}件, "
+            f"{self.raw_bytes / 1e6:.1f}MB -> {self.stored_bytes / 1e6:.2f}MB（{ratio:.1f}分の1）"
+        )
+
+
+def raw_stats(db_path=None):
+    conn = connection(db_path)
+    responses, raw_bytes = conn.execute("""
+        SELECT COUNT(*), COALESCE(SUM(p.raw_size), 0)
+        FROM responses r JOIN payloads p ON p.payload_id = r.payload_id
+    """).fetchone()
+    payloads, stored_bytes = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM payloads"
+    ).fetchone()
+    return RawStats(responses, payloads, raw_bytes, stored_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生のレスポンスの保存状況")
+    parser.add_argument("--db", default=weather_db.DB_PATH, help="weather.db のパス（隣の _raw.db を読む）")
+    parser.add_argument("--raw-db", help="生のレスポンスのDBのパス")
+    args = parser.parse_args()
+
+    weather_db.DB_PATH = args.db
+    path = args.raw_db or raw_db_path()
+    if not os.path.exists(path):
+        parser.exit(1, f"{path} はまだありません\n")
+    print(f"{path}: {raw_stats(path)}")
+    weather_db.close_all()
+
+
+if __name__ == "__main__":
+    main()
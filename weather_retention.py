@@ -0,0 +1,246 @@
+"""予報履歴の保持期間管理
+
+古い取得を間引き、さらに古いものは月ごとのアーカイブDBに移して、
+weather.db を小さく保つ。
+
+使い方:
+    python weather_retention.py                      # 既定の保持ポリシーで実行
+    python weather_retention.py --full-days 14 --daily-days 180
+    python weather_retention.py --no-archive         # アーカイブせずに削除
+"""
+import argparse
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+import weather_db
+
+# 月ごとのアーカイブDBを置くディレクトリ
+ARCHIVE_DIR = "archive"
+
+
+@dataclass
+class RetentionPolicy:
+    """保持ポリシー
+
+    full_days より新しい取得はすべて残し、daily_days までは1日1回分（その日の最後）だけ残す。
+    daily_days より古い取得はアーカイブDBに移す（archive_dir が None なら削除する）。
+    """
+    full_days: int = 30
+    daily_days: int = 365
+    archive_dir: str = ARCHIVE_DIR
+
+
+@dataclass
+class RetentionReport:
+    """保持処理の結果"""
+    thinned_runs: int = 0
+    archived_runs: int = 0
+    rebased_snapshots: int = 0
+    removed_snapshots: int = 0
+    freed_pages: int = 0
+    archive_files: list = field(default_factory=list)
+
+    def __str__(self):
+        return (
+            f"間引き{self.thinned_runs}件, アーカイブ{self.archived_runs}件, "
+            f"差分の付け替え{self.rebased_snapshots}件, "
+            f"スナップショット削除{self.removed_snapshots}件, 解放{self.freed_pages}ページ"
+        )
+
+
+def archive_path(month, archive_dir=ARCHIVE_DIR):
+    """月（YYYY-MM）のアーカイブDBのパス"""
+    return os.path.join(archive_dir, f"weather-{month}.db")
+
+
+def list_archives(archive_dir=ARCHIVE_DIR):
+    """存在するアーカイブの月の一覧（古い順）"""
+    if not os.path.isdir(archive_dir):
+        return []
+    months = []
+    for name in os.listdir(archive_dir):
+        if name.startswith("weather-") and name.endswith(".db"):
+            months.append(name[len("weather-"):-len(".db")])
+    return sorted(months)
+
+
+def attach_archive(conn, month, archive_dir=ARCHIVE_DIR):
+    """アーカイブDBを ATTACH してスキーマ名を返す（SQLで横断集計する用）"""
+    path = archive_path(month, archive_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    schema = "archive_" + month.replace("-", "_")
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    if schema not in attached:
+        conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+    return schema
+
+
+def detach_archive(conn, schema):
+    """attach_archive() で付けたDBを外す"""
+    conn.execute("DETACH DATABASE " + schema)
+
+
+def get_archived_forecasts(area_code, target_date, archive_dir=ARCHIVE_DIR):
+    """アーカイブから指定日に取得した予報を読む（get_forecasts_from_db と同じ形式）"""
+    path = archive_path(target_date[:7], archive_dir)
+    if not os.path.exists(path):
+        return []
+    conn = weather_db.get_connection(path)
+    row = conn.execute("""
+        SELECT snapshot_id, fetched_at FROM fetch_runs
+        WHERE area_code = ? AND fetch_date = ?
+        ORDER BY fetched_at DESC
+        LIMIT 1
+    """, (area_code, target_date)).fetchone()
+    if row is None:
+        return []
+    snapshot_id, fetched_at = row
+    content = weather_db.load_snapshot(conn, snapshot_id)
+    return [
+        (date_str, weather_code, weather, temp_min, temp_max, fetched_at)
+        for date_str, (weather_code, weather, temp_min, temp_max) in sorted(content.items())
+    ]
+
+
+def _format_time(dt):
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _thin_runs(conn, cutoff):
+    """cutoff より古い取得を1日1回分（その日の最後）に間引く"""
+    return conn.execute("""
+        DELETE FROM fetch_runs WHERE run_id IN (
+            SELECT run_id FROM (
+                SELECT run_id, ROW_NUMBER() OVER (
+                    PARTITION BY area_code, fetch_date ORDER BY fetched_at DESC
+                ) AS rn
+                FROM fetch_runs
+                WHERE fetched_at < ?
+            )
+            WHERE rn > 1
+        )
+    """, (cutoff,)).rowcount
+
+
+def _archive_runs(conn, cutoff, archive_dir, report):
+    """cutoff より古い取得を月ごとのアーカイブDBにコピーして削除"""
+    runs = conn.execute("""
+        SELECT run_id, area_code, area_name, fetched_at, snapshot_id
+        FROM fetch_runs
+        WHERE fetched_at < ?
+        ORDER BY area_code, fetched_at
+    """, (cutoff,)).fetchall()
+    if not runs:
+        return
+
+    by_month = {}
+    for run in runs:
+        by_month.setdefault(run[3][:7], []).append(run)
+
+    if archive_dir is not None:
+        os.makedirs(archive_dir, exist_ok=True)
+        for month, month_runs in sorted(by_month.items()):
+            path = archive_path(month, archive_dir)
+            weather_db.migrate(path)
+            # アーカイブ側も同じ形式（重複排除・差分）で保存する
+            with weather_db.transaction(path) as archive_conn:
+                for run_id, area_code, area_name, fetched_at, snapshot_id in month_runs:
+                    content = weather_db.load_snapshot(conn, snapshot_id)
+                    weather_db.save_content(archive_conn, area_code, area_name, content, fetched_at)
+            report.archive_files.append(path)
+
+    # アーカイブへの書き込みが終わってから本体から消す（途中で止まっても再実行できる）
+    with weather_db.transaction():
+        conn.executemany(
+            "DELETE FROM fetch_runs WHERE run_id = ?", [(run[0],) for run in runs]
+        )
+    report.archived_runs = len(runs)
+
+
+def _rebase_old_snapshots(conn, cutoff):
+    """間引いた取得の差分を飛ばして、残った取得どうしの差分に付け替える"""
+    rebased = 0
+    previous = {}
+    for area_code, snapshot_id, base_id in conn.execute("""
+        SELECT r.area_code, r.snapshot_id, s.base_id
+        FROM fetch_runs r JOIN snapshots s ON s.snapshot_id = r.snapshot_id
+        WHERE r.fetched_at < ?
+        ORDER BY r.area_code, r.fetched_at
+    """, (cutoff,)).fetchall():
+        prev_id = previous.get(area_code)
+        previous[area_code] = snapshot_id
+        if snapshot_id == prev_id or base_id == prev_id or base_id is None:
+            continue
+        if weather_db.rebase_snapshot(conn, snapshot_id, prev_id):
+            rebased += 1
+    return rebased
+
+
+def _ensure_incremental_vacuum(conn):
+    """auto_vacuum を INCREMENTAL にする（既存DBは1回だけVACUUMが必要）"""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        print("auto_vacuum を INCREMENTAL に変更（初回のみVACUUM）")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+def apply_retention(policy=None, now=None):
+    """保持ポリシーを適用して weather.db を整理"""
+    policy = policy or RetentionPolicy()
+    now = now or datetime.now()
+    full_cutoff = _format_time(now - timedelta(days=policy.full_days))
+    archive_cutoff = _format_time(now - timedelta(days=policy.daily_days))
+    report = RetentionReport()
+
+    conn = weather_db.get_connection()
+    with weather_db.transaction():
+        report.thinned_runs = _thin_runs(conn, full_cutoff)
+
+    _archive_runs(conn, archive_cutoff, policy.archive_dir, report)
+
+    with weather_db.transaction():
+        report.rebased_snapshots = _rebase_old_snapshots(conn, full_cutoff)
+        report.removed_snapshots = weather_db.collect_garbage(conn)
+
+    _ensure_incremental_vacuum(conn)
+    report.freed_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # incremental_vacuum は1ステップで1ページずつ解放する
+    # execute() だと1ステップしか進まないので executescript() で最後まで実行する
+    conn.executescript("PRAGMA incremental_vacuum;")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    # 取得を消したので、日付一覧などの読み取りキャッシュも捨てる
+    weather_db.clear_query_cache()
+
+    print(f"保持ポリシーを適用: {report}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="予報履歴の間引き・アーカイブ")
+    parser.add_argument("--db", default=weather_db.DB_PATH, help="DBファイルのパス")
+    parser.add_argument("--full-days", type=int, default=30, help="全件を残す日数")
+    parser.add_argument("--daily-days", type=int, default=365, help="1日1回分を残す日数")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="アーカイブDBの保存先")
+    parser.add_argument("--no-archive", action="store_true", help="アーカイブせずに削除する")
+    args = parser.parse_args()
+
+    if args.daily_days < args.full_days:
+        parser.error("--daily-days は --full-days 以上にしてください")
+
+    weather_db.DB_PATH = args.db
+    weather_db.migrate()
+    policy = RetentionPolicy(
+        full_days=args.full_days,
+        daily_days=args.daily_days,
+        archive_dir=None if args.no_archive else args.archive_dir,
+    )
+    try:
+        apply_retention(policy)
+    finally:
+        weather_db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""天気予報の取得・解析・保存（Fletに依存しない処理）
+
+UIからもコマンドラインからも使えるよう、画面の処理とは分けている。
+"""
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import partial
+
+import requests
+
+from jma_parser import summarize_daily
+from weather_raw import store_response
+from weather_db import (
+    WriteStats,
+    get_available_dates,
+    get_forecasts_from_db,
+    resolve_forecast_area,
+    save_forecast_to_db,
+    save_forecasts_bulk,
+)
+from weather_timing import span
+
+
+# 保存分がこの秒数より新しければ、地域を選んだときに気象庁APIに確認しない
+# （lecture-6 の --ttl で変更できる）
+FORECAST_TTL = 600
+
+# APIで天気予報が提供されていない地域コード（404エラーになる）
+EXCLUDED_AREA_CODES = {
+    "014030",  # 十勝地方
+    "460040",  # 奄美地方
+}
+
+
+class NoForecastDataError(Exception):
+    """気象庁がこの地域の予報を提供していない（DBへのフォールバックもしない）"""
+
+
+def parse_forecast_data(forecast_data):
+    """APIレスポンスから天気データを解析（気温・天気コードは数値で返す）
+
+    予報の先頭の地域（例: 東京地方）の日別データを返す。
+    全地域・全項目が必要なときは jma_parser を使う。
+    """
+    regions = summarize_daily(forecast_data, first_only=True)
+    if not regions:
+        return {}
+    return next(iter(regions.values()))["days"]
+
+
+def download_forecast(client, area_code, fetched_at=None, area_name=None):
+    """気象庁APIから予報のJSONを取得
+
+    fetched_at を渡すと、JSONとして読めた生のレスポンスを weather_raw に保存する
+    （あとで解析し直せるように）。
+    """
+    with span("fetch.http", area_code=area_code):
+        response = client.get_forecast(area_code)
+
+    # ステータスコードチェック
+    if response.status_code != 200:
+        raise Exception(f"APIエラー: ステータスコード {response.status_code}")
+
+    # レスポンスが空かチェック
+    if not response.text or response.text.strip() == "":
+        raise Exception("この地域の天気予報データは提供されていません")
+
+    try:
+        with span("fetch.json", area_code=area_code):
+            forecast_data = response.json()
+    except requests.exceptions.JSONDecodeError:
+        raise NoForecastDataError("この地域の天気予報データは現在提供されていません")
+
+    # データが空かチェック
+    if not forecast_data or len(forecast_data) == 0:
+        raise Exception("天気予報データが空です")
+
+    # JSONとして読めた本文だけを保存する（weather_backfill が読み直すときに失敗しないように）
+    if fetched_at is not None:
+        try:
+            with span("save.raw", area_code=area_code):
+                store_response(area_code, area_name, fetched_at, response.content)
+        except sqlite3.Error as e:
+            # 生のレスポンスを保存できなくても予報の表示・保存は続ける
+            print(f"生のレスポンスの保存に失敗: {e}")
+
+    return forecast_data
+
+
+def parse_or_raise(forecast_data):
+    """予報を解析（天気データがなければ例外）"""
+    with span("parse"):
+        weather_dict = parse_forecast_data(forecast_data)
+    if not weather_dict:
+        raise Exception("天気データを解析できませんでした")
+    return weather_dict
+
+
+def fetch_forecast(client, area_code):
+    """気象庁APIから予報を取得して解析（保存はしない）"""
+    return parse_or_raise(download_forecast(client, area_code))
+
+
+def split_forecast(forecast_data, area_code, area_name):
+    """オフィスの予報を [(地域コード, 地域名, 日別データ), ...] に分ける
+
+    先頭はオフィス自身（先頭の一次細分区域の予報、parse_forecast_data と同じ）、
+    続いて一次細分区域（class10）ごとの予報。1回の取得で府県内の全区域が埋まる。
+    """
+    with span("parse"):
+        regions = summarize_daily(forecast_data)
+    days = next(iter(regions.values()))["days"] if regions else None
+    if not days:
+        raise Exception("天気データを解析できませんでした")
+    areas = [(area_code, area_name, days)]
+    areas.extend(
+        (code, region["name"], region["days"])
+        for code, region in regions.items()
+        # 大阪府のようにオフィスと同じコードの区域は先頭の行と同じ
+        if code != area_code and region["days"]
+    )
+    return areas
+
+
+def fetch_and_store(client, area_code, area_name):
+    """オフィスの予報をAPIから取得し、一次細分区域ごとの予報と一緒にDBに保存"""
+    fetched_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    forecast_data = download_forecast(client, area_code, fetched_at, area_name)
+    areas = split_forecast(forecast_data, area_code, area_name)
+    with span("save", area_code=area_code):
+        if len(areas) == 1:
+            return save_forecast_to_db(area_code, area_name, areas[0][2], fetched_at)
+        return save_forecasts_bulk(
+            (code, name, days, fetched_at) for code, name, days in areas
+        )
+
+
+@dataclass
+class ForecastResult:
+    """画面に表示する予報（rows は get_forecasts_from_db の結果）"""
+    area_code: str
+    area_name: str
+    rows: list = field(default_factory=list)
+    dates: list = field(default_factory=list)
+    error: str = None
+    source: str = "api"  # "api" = 今回取得した分, "db" = 取得しなかった・失敗したのでDBの保存分
+    refreshing: bool = False  # 裏で最新の予報を取得中（あとで取得結果がもう一度届く）
+    forecast_area_code: str = None  # rows を読んだ地域（市町村なら一次細分区域）
+
+    @property
+    def fetched_at(self):
+        return self.rows[0][5] if self.rows else None
+
+    def age(self, now=None):
+        """保存分を取得してからの秒数（保存分がなければ None）"""
+        if not self.fetched_at:
+            return None
+        now = now or datetime.now()
+        return (now - datetime.strptime(self.fetched_at, "%Y-%m-%d %H:%M:%S")).total_seconds()
+
+
+def _display_target(area_code, area_name):
+    """(予報を読む地域, 表示名)。市町村などは一次細分区域の名前を添える"""
+    target = resolve_forecast_area(area_code)
+    if target.area_code != area_code:
+        area_name = f"{area_name}（{target.area_name}）"
+    return target, area_name
+
+
+def read_stored_forecast(area_code, area_name):
+    """DBの保存分だけを読む（通信しない）"""
+    target, area_name = _display_target(area_code, area_name)
+    with span("query.stored", area_code=area_code):
+        rows = get_forecasts_from_db(target.area_code)
+        dates = get_available_dates(target.area_code) if rows else []
+    return ForecastResult(
+        area_code, area_name, rows, dates, source="db", forecast_area_code=target.area_code
+    )
+
+
+def load_area_forecast(client, area_code, area_name, refresh=None):
+    """APIから取得→DBに保存→DBから読み込み（失敗時はDBの保存分にフォールバック）
+
+    市町村などの細分区域は、オフィスの予報を取得して一次細分区域の予報を表示する。
+    refresh(office_code, office_name) を渡すと fetch_and_store の代わりに使う。
+    """
+    target, area_name = _display_target(area_code, area_name)
+    refresh = refresh or partial(fetch_and_store, client)
+    try:
+        refresh(target.office_code, target.office_name or area_name)
+        source, error = "api", None
+    except NoForecastDataError as e:
+        # JSONパースエラー（データが提供されていない地域）
+        print(f"JSONパースエラー: {area_name}")
+        return ForecastResult(
+            area_code, area_name, error=str(e), source="db", forecast_area_code=target.area_code
+        )
+    except requests.exceptions.Timeout:
+        print(f"タイムアウト: {area_name}")
+        source, error = "db", "接続がタイムアウトしました"
+    except Exception as e:
+        print(f"API取得エラー: {e}")
+        source, error = "db", str(e)
+
+    with span("query", area_code=area_code):
+        rows = get_forecasts_from_db(target.area_code)
+        dates = get_available_dates(target.area_code) if rows else []
+    return ForecastResult(area_code, area_name, rows, dates, error, source, False, target.area_code)
+
+
+class ForecastLoader:
+    """予報の読み込みをワーカースレッドで行い、最後に選ばれた地域の結果だけを通知する"""
+
+    def __init__(self, client, max_workers=4, load=None, executor=None):
+        """load(area_code, area_name) を渡すと load_area_forecast の代わりに使う。
+        executor を渡すとそのワーカースレッドを使う（shutdown では止めない）。
+        """
+        self.client = client
+        self._load = load or partial(load_area_forecast, client)
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="forecast")
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._pending = None
+
+    def load(self, area_code, area_name, on_done, stale_after=None):
+        """読み込みを開始（前の地域の読み込みはキャンセル、実行中なら結果を捨てる）
+
+        on_done(result) はワーカースレッドから呼ばれる。
+        stale_after（秒）を指定すると、DBに保存分があればまずそれで on_done を呼び
+        （呼び出し元のスレッドから、通信を待たない）、保存分が stale_after 秒より古いときだけ
+        裏で取得して、取得結果でもう一度 on_done を呼ぶ。
+        """
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            if self._pending is not None:
+                self._pending.cancel()
+                self._pending = None
+
+        if stale_after is not None:
+            stored = read_stored_forecast(area_code, area_name)
+            if stored.rows:
+                fresh = stored.age() < stale_after
+                stored.refreshing = not fresh
+                if self.is_current(generation):
+                    on_done(stored)
+                if fresh:
+                    return
+
+        with self._lock:
+            # 保存分を表示している間に別の地域が選ばれていたら取得しない
+            if self.is_current(generation):
+                self._pending = self._executor.submit(
+                    self._run, generation, area_code, area_name, on_done
+                )
+
+    def cancel(self):
+        """実行待ち・実行中の読み込みの結果を捨てる"""
+        with self._lock:
+            self._generation += 1
+            if self._pending is not None:
+                self._pending.cancel()
+                self._pending = None
+
+    def is_current(self, generation):
+        return generation == self._generation
+
+    def _run(self, generation, area_code, area_name, on_done):
+        if not self.is_current(generation):
+            return
+        with span("load", area_code=area_code):
+            result = self._load(area_code, area_name)
+        # 待っている間に別の地域が選ばれていたら表示しない
+        if self.is_current(generation):
+            on_done(result)
+
+    def shutdown(self):
+        self.cancel()
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+
+@dataclass
+class AreaSyncResult:
+    """一括同期での1地域分の結果（時間は秒）"""
+    area_code: str
+    area_name: str
+    fetch_time: float = 0.0
+    parse_time: float = 0.0
+    days: int = 0
+    error: str = None
+
+
+@dataclass
+class SyncReport:
+    """一括同期の結果"""
+    results: list = field(default_factory=list)
+    stats: WriteStats = field(default_factory=WriteStats)
+    save_time: float = 0.0
+    elapsed: float = 0.0
+
+    @property
+    def failures(self):
+        return [r for r in self.results if r.error]
+
+    def summary(self):
+        ok = len(self.results) - len(self.failures)
+        return (
+            f"{len(self.results)}地域を同期: 成功{ok}件, 失敗{len(self.failures)}件, "
+            f"{self.elapsed:.1f}秒（保存{self.save_time:.2f}秒） {self.stats}"
+        )
+
+    def print_details(self):
+        """地域ごとの所要時間と失敗を表示"""
+        for r in sorted(self.results, key=lambda r: r.fetch_time + r.parse_time, reverse=True):
+            status = f"失敗: {r.error}" if r.error else f"{r.days}日分"
+            print(
+                f"  {r.area_code} {r.area_name:<12} 取得{r.fetch_time * 1000:7.0f}ms "
+                f"解析{r.parse_time * 1000:5.1f}ms  {status}"
+            )
+        print(self.summary())
+
+
+def sync_targets(offices):
+    """一括同期の対象（予報が提供されていない地域を除いたオフィス）"""
+    return [
+        (code, info.get("name", ""))
+        for code, info in offices.items()
+        if code not in EXCLUDED_AREA_CODES
+    ]
+
+
+def _sync_one(client, area_code, area_name):
+    """1オフィス分を取得・解析（ワーカースレッドで実行）。一次細分区域の分も返す"""
+    result = AreaSyncResult(area_code, area_name)
+    started = time.perf_counter()
+    fetched_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        forecast_data = download_forecast(client, area_code, fetched_at, area_name)
+        result.fetch_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        areas = split_forecast(forecast_data, area_code, area_name)
+        result.parse_time = time.perf_counter() - started
+        result.days = len(areas[0][2])
+        return result, [(code, name, days, fetched_at) for code, name, days in areas]
+    except Exception as e:
+        result.fetch_time = result.fetch_time or time.perf_counter() - started
+        result.error = str(e) or type(e).__name__
+        return result, None
+
+
+def sync_all_offices(client, offices, concurrency=8, batch_size=20, on_progress=None):
+    """全オフィスの予報を並列に取得し、まとめてDBに保存
+
+    取得と解析は concurrency 個のワーカースレッドで並列に行い、
+    保存は呼び出し元のスレッドで batch_size 地域（一次細分区域を含む）ずつ1トランザクションにまとめる。
+    on_progress(done, total) を渡すと1地域終わるごとに呼ぶ。
+    """
+    targets = sync_targets(offices)
+    report = SyncReport()
+    started = time.perf_counter()
+    batch = []
+
+    def flush():
+        save_started = time.perf_counter()
+        with span("save.bulk", areas=len(batch)):
+            report.stats += save_forecasts_bulk(batch)
+        report.save_time += time.perf_counter() - save_started
+        batch.clear()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="sync") as executor:
+        futures = [
+            executor.submit(_sync_one, client, code, name) for code, name in targets
+        ]
+        for future in as_completed(futures):
+            result, forecasts = future.result()
+            report.results.append(result)
+            if forecasts is not None:
+                batch.extend(forecasts)
+                if len(batch) >= batch_size:
+                    flush()
+            if on_progress:
+                on_progress(len(report.results), len(targets))
+    if batch:
+        flush()
+
+    report.elapsed = time.perf_counter() - started
+    return report
@@ -0,0 +1,60 @@
+"""全オフィスの天気予報を一括で取得してDBに保存するコマンド
+
+使い方:
+    python weather_sync.py                  # 8並列で同期
+    python weather_sync.py --concurrency 16 --batch-size 30
+    python weather_sync.py --timing         # 区間ごとの処理時間も表示
+"""
+import argparse
+
+import weather_analytics
+import weather_db
+import weather_timing
+from jma_client import JmaClient
+from weather_service import sync_all_offices
+
+
+def load_offices(client):
+    """オフィス一覧を取得（気象庁APIに失敗したらDBの保存分を使う）"""
+    try:
+        return client.get_area_json().json().get("offices", {})
+    except Exception as e:
+        print(f"地域データの取得に失敗（DBの保存分を使用）: {e}")
+        return weather_db.load_area_hierarchy()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全オフィスの天気予報を一括同期")
+    parser.add_argument("--db", default=weather_db.DB_PATH, help="DBファイルのパス")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に取得する地域数")
+    parser.add_argument("--batch-size", type=int, default=20, help="1トランザクションで保存する地域数")
+    parser.add_argument("--timing", metavar="JSON", nargs="?", const="",
+                        help="区間ごとの処理時間を表示（ファイル名を付けるとJSONでも保存）")
+    args = parser.parse_args()
+    if args.timing is not None:
+        weather_timing.enable()
+
+    weather_db.DB_PATH = args.db
+    weather_db.init_database()
+    weather_analytics.register()
+    client = JmaClient(pool_size=args.concurrency)
+    try:
+        offices = load_offices(client)
+        if not offices:
+            parser.exit(1, "同期する地域がありません\n")
+        report = sync_all_offices(
+            client, offices, concurrency=args.concurrency, batch_size=args.batch_size
+        )
+        report.print_details()
+        if args.timing is not None:
+            print(weather_timing.format_report())
+            if args.timing:
+                weather_timing.dump(args.timing)
+    finally:
+        weather_db.close_all()
+    if report.failures:
+        parser.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""処理時間の計測（取得・解析・保存・読み込み・表示）
+
+with span("fetch.http"): のように囲んだ区間の時間を、区間名ごとのヒストグラムに集計する。
+計測が無効のときは何もしない共通のオブジェクトを返すだけなので、ほぼ負荷はない。
+環境変数 WEATHER_TIMING=1 か enable() で有効になる。
+
+集計結果は format_report() で表にするか、dump() でJSONファイルに保存する。
+遅かった区間は地域コードなどのラベル付きで直近の分だけ残す（slow_spans()）。
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+_enabled = os.environ.get("WEATHER_TIMING", "") not in ("", "0")
+
+# ヒストグラムの区切り（ミリ秒）。1-2-5 の刻みで 0.1ms〜60秒
+BUCKET_BOUNDS_MS = tuple(
+    base * scale
+    for scale in (0.1, 1, 10, 100, 1000, 10000)
+    for base in (1, 2, 5)
+) + (60000,)
+
+# この時間（秒）を超えた区間はラベル付きで残す
+SLOW_THRESHOLD = 1.0
+SLOW_SPAN_LIMIT = 100
+
+
+class Histogram:
+    """1つの区間の所要時間の分布"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.min = ms if self.min is None else min(self.min, ms)
+        self.max = ms if self.max is None else max(self.max, ms)
+
+    def percentile(self, p):
+        """p パーセンタイル（ミリ秒）。区切りの上端で近似し、最大値を超えない"""
+        if not self.count:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                bound = BUCKET_BOUNDS_MS[index] if index < len(BUCKET_BOUNDS_MS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total, 3),
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "min_ms": round(self.min or 0.0, 3),
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max or 0.0, 3),
+            "buckets": {
+                (f"<={bound:g}" if index < len(BUCKET_BOUNDS_MS) else f">{BUCKET_BOUNDS_MS[-1]:g}"): count
+                for index, (bound, count) in enumerate(zip(BUCKET_BOUNDS_MS + (None,), self.counts))
+                if count
+            },
+        }
+
+
+_lock = threading.Lock()
+_histograms = {}
+_slow_spans = deque(maxlen=SLOW_SPAN_LIMIT)
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled():
+    return _enabled
+
+
+def record(name, seconds, **labels):
+    """計測した時間を記録（無効なら何もしない）"""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.record(seconds)
+        if seconds >= SLOW_THRESHOLD:
+            _slow_spans.append({
+                "name": name,
+                "ms": round(seconds * 1000, 1),
+                "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "thread": threading.current_thread().name,
+                **labels,
+            })
+
+
+class _Span:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self.labels
+        if exc_type is not None:
+            labels = dict(labels, error=exc_type.__name__)
+        record(self.name, time.perf_counter() - self.started, **labels)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **labels):
+    """with 文で囲んだ区間の時間を計測する"""
+    if not _enabled:
+        return _NOOP
+    return _Span(name, labels)
+
+
+def snapshot():
+    """区間名 -> 集計結果の辞書"""
+    with _lock:
+        return {name: histogram.summary() for name, histogram in sorted(_histograms.items())}
+
+
+def slow_spans():
+    """SLOW_THRESHOLD を超えた直近の区間（新しい順）"""
+    with _lock:
+        return list(reversed(_slow_spans))
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _slow_spans.clear()
+
+
+def format_report():
+    """集計結果を表の文字列にする"""
+    stats = snapshot()
+    if not stats:
+        return "計測結果はまだありません" if _enabled else "計測は無効です（WEATHER_TIMING=1 で有効）"
+    lines = [f"{'区間':<20}{'回数':>6}{'平均':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'最大':>10}  (ms)"]
+    for name, s in stats.items():
+        lines.append(
+            f"{name:<22}{s['count']:>6}{s['mean_ms']:>9.1f}{s['p50_ms']:>9.1f}"
+            f"{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>10.1f}"
+        )
+    slow = slow_spans()
+    if slow:
+        lines.append("")
+        lines.append(f"{SLOW_THRESHOLD:g}秒を超えた区間（新しい順）:")
+        for item in slow[:10]:
+            labels = ", ".join(f"{k}={v}" for k, v in item.items() if k not in ("name", "ms", "at"))
+            lines.append(f"  {item['at']} {item['name']} {item['ms']:.0f}ms {labels}")
+    return "\n".join(lines)
+
+
+def dump(path):
+    """集計結果をJSONファイルに保存"""
+    data = {
+        "dumped_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "spans": snapshot(),
+        "slow_spans": slow_spans(),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return path
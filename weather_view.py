@@ -0,0 +1,424 @@
+"""天気予報の表示部品（Flet）
+
+画面の部品は最初に1回だけ作り、地域や日付を切り替えたときは
+既存の部品の値だけを書き換える（部品ツリーを作り直さない）。
+"""
+import flet as ft
+
+import weather_timing
+from weather_codes import classify, short_text
+
+# 一度に表示するカードの数
+MAX_CARDS = 7
+
+
+def format_age(seconds):
+    """取得からの経過秒数を「3時間前」のような表示にする"""
+    if seconds is None:
+        return ""
+    if seconds < 60:
+        return "たった今"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}分前"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)}時間前"
+    return f"{int(seconds // 86400)}日前"
+
+
+class WeatherCard(ft.Container):
+    """1日分の天気予報カード"""
+
+    def __init__(self):
+        super().__init__()
+        self.date_text = ft.Text("", size=14, weight=ft.FontWeight.BOLD)
+        self.icon_text = ft.Text("", size=40)
+        self.weather_text = ft.Text("", size=11, text_align=ft.TextAlign.CENTER)
+        self.temp_min_text = ft.Text("-", color=ft.Colors.BLUE, size=12)
+        self.temp_max_text = ft.Text("-", color=ft.Colors.RED, size=12)
+
+        self.content = ft.Column(
+            controls=[
+                self.date_text,
+                self.icon_text,
+                ft.Container(
+                    content=self.weather_text,
+                    width=120,
+                    height=40,
+                    alignment=ft.alignment.center,
+                ),
+                ft.Row(
+                    controls=[self.temp_min_text, ft.Text("/", size=12), self.temp_max_text],
+                    alignment=ft.MainAxisAlignment.CENTER,
+                ),
+            ],
+            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+            spacing=5,
+        )
+        self.width = 150
+        self.height = 180
+        self.padding = 10
+        self.border_radius = 10
+        self.bgcolor = ft.Colors.WHITE
+        self.shadow = ft.BoxShadow(
+            spread_radius=1,
+            blur_radius=5,
+            color=ft.Colors.with_opacity(0.2, ft.Colors.BLACK),
+        )
+        self.visible = False
+
+    def set_forecast(self, date, weather_code, weather, temp_min, temp_max):
+        """カードの値を書き換える（アイコンは天気コードから引く）"""
+        kind = classify(weather_code, weather)
+        self.date_text.value = date
+        self.icon_text.value = kind.icon
+        # 週間予報の日は天気テキストがないので、天気コードの表示名を使う
+        self.weather_text.value = short_text(weather) if weather else kind.label
+        self.temp_min_text.value = f"{temp_min}°C" if temp_min is not None else "-"
+        self.temp_max_text.value = f"{temp_max}°C" if temp_max is not None else "-"
+        self.visible = True
+
+
+class ForecastView(ft.Container):
+    """天気予報の表示エリア（案内・読み込み中・予報・エラーを切り替える）"""
+
+    def __init__(self):
+        super().__init__()
+        self.expand = True
+
+        self.welcome = self._build_welcome()
+
+        self.loading_text = ft.Text("", size=14, color=ft.Colors.GREY_600)
+        self.loading = ft.Container(
+            content=ft.Column(
+                controls=[ft.ProgressRing(), self.loading_text],
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                spacing=15,
+            ),
+            padding=40,
+            alignment=ft.alignment.center,
+            visible=False,
+        )
+
+        self.title_text = ft.Text("", size=20, weight=ft.FontWeight.BOLD)
+        self.source_text = ft.Text("SQLite DBから表示", size=12, color=ft.Colors.GREEN_700,
+                                   weight=ft.FontWeight.W_500)
+        self.refresh_ring = ft.ProgressRing(width=12, height=12, stroke_width=2, visible=False)
+        self.cards = [WeatherCard() for _ in range(MAX_CARDS)]
+        self.forecast = ft.Container(
+            content=ft.Column(
+                controls=[
+                    ft.Container(content=self.title_text, padding=ft.padding.only(bottom=5)),
+                    ft.Container(
+                        content=ft.Row(
+                            controls=[
+                                ft.Icon(ft.Icons.STORAGE, size=16, color=ft.Colors.GREEN_700),
+                                self.source_text,
+                                self.refresh_ring,
+                            ],
+                            spacing=5,
+                        ),
+                        padding=ft.padding.only(bottom=10),
+                    ),
+                    ft.Row(controls=self.cards, wrap=True, spacing=15, run_spacing=15),
+                ],
+            ),
+            padding=20,
+            visible=False,
+        )
+
+        self.error_title = ft.Text("", size=18, weight=ft.FontWeight.BOLD)
+        self.error_text = ft.Text("", size=14, color=ft.Colors.GREY_600)
+        self.error = ft.Container(
+            content=ft.Column(
+                controls=[
+                    ft.Icon(ft.Icons.ERROR_OUTLINE, size=60, color=ft.Colors.ORANGE_400),
+                    self.error_title,
+                    self.error_text,
+                    ft.Container(height=10),
+                    ft.Text("他の地域を選択してください", size=12, color=ft.Colors.GREY_500),
+                ],
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                spacing=10,
+            ),
+            padding=40,
+            alignment=ft.alignment.center,
+            visible=False,
+        )
+
+        self.content = ft.Column(
+            controls=[self.welcome, self.loading, self.forecast, self.error],
+            scroll=ft.ScrollMode.AUTO,
+            expand=True,
+        )
+
+    @staticmethod
+    def _build_welcome():
+        """初期表示の案内"""
+        def feature(text):
+            return ft.Row(
+                controls=[
+                    ft.Icon(ft.Icons.CHECK_CIRCLE, size=16, color=ft.Colors.GREEN),
+                    ft.Text(text, size=12, color=ft.Colors.GREY_600),
+                ],
+                spacing=5,
+            )
+
+        return ft.Container(
+            content=ft.Column(
+                controls=[
+                    ft.Icon(ft.Icons.CLOUD, size=100, color=ft.Colors.GREY_400),
+                    ft.Text("左側のリストから地域を選択してください", size=16, color=ft.Colors.GREY_600),
+                    ft.Container(height=20),
+                    ft.Container(
+                        content=ft.Column(
+                            controls=[
+                                feature("天気情報はSQLiteデータベースに保存されます"),
+                                feature("表示データはDBから取得されます（JSON→DB移行）"),
+                                feature("過去の予報データも閲覧可能です"),
+                            ],
+                            spacing=8,
+                        ),
+                        padding=20,
+                        border_radius=10,
+                        bgcolor=ft.Colors.with_opacity(0.05, ft.Colors.BLACK),
+                    ),
+                ],
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                alignment=ft.MainAxisAlignment.CENTER,
+            ),
+            expand=True,
+            alignment=ft.alignment.center,
+        )
+
+    def _show(self, panel):
+        for child in (self.welcome, self.loading, self.forecast, self.error):
+            child.visible = child is panel
+
+    def show_loading(self, area_name):
+        self.loading_text.value = f"{area_name}の天気予報を取得中..."
+        self._show(self.loading)
+
+    def show_error(self, area_name, message):
+        self.error_title.value = area_name
+        self.error_text.value = message
+        self._show(self.error)
+
+    def show_forecast(self, area_name, rows, fetch_date=None, age=None, refreshing=False, error=None):
+        """get_forecasts_from_db() の行を表示（カードは使い回し、余った分は隠す）
+
+        age は保存分の取得からの秒数。refreshing なら裏で最新の予報を取得中の印を出す。
+        error は取得に失敗して保存分を表示しているときの理由。
+        """
+        title = f"{area_name}の天気予報"
+        if fetch_date:
+            title += f"（{fetch_date} 取得分）"
+        self.title_text.value = title
+
+        source = "SQLite DBから表示"
+        if age is not None:
+            source += f"（{format_age(age)}に取得）"
+        if refreshing:
+            source += " 最新の予報を確認中..."
+        elif error:
+            source += f" 更新できませんでした: {error}"
+        self.source_text.value = source
+        self.source_text.color = ft.Colors.ORANGE_700 if error and not refreshing else ft.Colors.GREEN_700
+        self.refresh_ring.visible = refreshing
+
+        rows = [row for row in rows if row[2] or row[1] is not None][:MAX_CARDS]
+        for card, row in zip(self.cards, rows):
+            date_str, weather_code, weather, temp_min, temp_max, fetched_at = row
+            card.set_forecast(date_str, weather_code, weather, temp_min, temp_max)
+        for card in self.cards[len(rows):]:
+            card.visible = False
+        self._show(self.forecast)
+
+
+# 検索結果を一度に表示する件数
+MAX_SEARCH_RESULTS = 20
+
+
+class RegionPanel(ft.Container):
+    """地域選択パネル（地方の中身は初めて開いたときに作る・検索ボックス付き）"""
+
+    def __init__(self, centers, offices, index, on_select, excluded=()):
+        super().__init__()
+        self.on_select = on_select
+        self.excluded = set(excluded)
+        self.width = 280
+        self.bgcolor = ft.Colors.WHITE
+        self.border = ft.border.only(right=ft.BorderSide(1, ft.Colors.GREY_300))
+
+        self.search_field = ft.TextField(
+            hint_text="地域名・コードで検索",
+            prefix_icon=ft.Icons.SEARCH,
+            dense=True,
+            text_size=14,
+            on_change=self._on_search_change,
+            on_submit=self._on_search_submit,
+        )
+        # 検索結果の行は使い回す（入力のたびに値と表示だけを書き換える）
+        self.result_tiles = [
+            ft.ListTile(
+                title=ft.Text("", size=14),
+                subtitle=ft.Text("", size=10, color=ft.Colors.GREY),
+                dense=True,
+                visible=False,
+                on_click=self._on_result_click,
+            )
+            for _ in range(MAX_SEARCH_RESULTS)
+        ]
+        self.no_result = ft.Text("該当する地域がありません", size=12, color=ft.Colors.GREY, visible=False)
+        self.results = ft.Column(
+            controls=[*self.result_tiles, ft.Container(content=self.no_result, padding=15)],
+            spacing=0,
+            visible=False,
+        )
+        self.tree = ft.Column(spacing=0)
+
+        self.content = ft.Column(
+            controls=[
+                ft.Container(
+                    content=ft.Text("地域を選択", size=16, weight=ft.FontWeight.BOLD),
+                    padding=ft.padding.only(left=15, top=10, bottom=5),
+                ),
+                ft.Container(content=self.search_field, padding=ft.padding.symmetric(horizontal=10, vertical=5)),
+                self.results,
+                self.tree,
+            ],
+            scroll=ft.ScrollMode.AUTO,
+            spacing=0,
+        )
+        self.set_areas(centers, offices, index)
+
+    def set_areas(self, centers, offices, index):
+        """地域データを差し替える（地方の見出しだけを作り直す）"""
+        self.offices = offices
+        self.index = index
+        self.tree.controls = [
+            ft.ExpansionTile(
+                title=ft.Text(info.get("name", ""), size=14),
+                subtitle=ft.Text(code, size=10, color=ft.Colors.GREY),
+                controls=[],
+                data=info.get("children", []),
+                initially_expanded=False,
+                collapsed_text_color=ft.Colors.BLACK,
+                text_color=ft.Colors.BLUE,
+                on_change=self._on_center_expand,
+            )
+            for code, info in centers.items()
+        ]
+        if self.search_field.value:
+            self._show_results(self.search_field.value)
+
+    def _office_tile(self, code, name):
+        return ft.ListTile(
+            title=ft.Text(name, size=14),
+            subtitle=ft.Text(code, size=10, color=ft.Colors.GREY),
+            on_click=lambda e: self.on_select(code, name),
+            dense=True,
+        )
+
+    def _on_center_expand(self, e):
+        """地方を初めて開いたときに中の地域の行を作る"""
+        tile = e.control
+        if tile.controls or e.data != "true":
+            return
+        tile.controls = [
+            self._office_tile(code, self.offices[code].get("name", ""))
+            for code in tile.data
+            # APIで対応していない地域はスキップ
+            if code in self.offices and code not in self.excluded
+        ]
+        tile.update()
+
+    def _show_results(self, query):
+        entries = [
+            entry for entry in self.index.search(query, MAX_SEARCH_RESULTS + len(self.excluded))
+            # 対応していないオフィスの細分区域も選べないようにする
+            if entry.code not in self.excluded
+            and (entry.area_type == "office" or entry.parent_code not in self.excluded)
+        ][:MAX_SEARCH_RESULTS]
+        for tile, entry in zip(self.result_tiles, entries):
+            tile.title.value = entry.name
+            if entry.area_type != "office":
+                # 市町村などは同じ名前が別の府県にもあるので、府県名を添える
+                office = self.offices.get(entry.parent_code, {}).get("name", "")
+                tile.subtitle.value = f"{entry.code}  {office}"
+            elif entry.en_name:
+                tile.subtitle.value = f"{entry.code}  {entry.en_name}"
+            else:
+                tile.subtitle.value = entry.code
+            tile.data = (entry.code, entry.name)
+            tile.visible = True
+        for tile in self.result_tiles[len(entries):]:
+            tile.visible = False
+        self.no_result.visible = not entries
+        self.results.visible = True
+        self.tree.visible = False
+        return entries
+
+    def _on_search_change(self, e):
+        query = (e.control.value or "").strip()
+        if query:
+            self._show_results(query)
+        else:
+            self.results.visible = False
+            self.tree.visible = True
+        self.update()
+
+    def _on_search_submit(self, e):
+        """Enterで先頭の候補を選ぶ"""
+        first = self.result_tiles[0]
+        if self.results.visible and first.visible:
+            self.on_select(*first.data)
+
+    def _on_result_click(self, e):
+        self.on_select(*e.control.data)
+
+
+class TimingDialog(ft.AlertDialog):
+    """処理時間の計測結果を表示するデバッグ用ダイアログ"""
+
+    def __init__(self, dump_path="weather_timing.json"):
+        super().__init__()
+        self.dump_path = dump_path
+        self.title = ft.Text("処理時間")
+        self.enabled_switch = ft.Switch(
+            label="計測する", value=weather_timing.is_enabled(), on_change=self._on_toggle,
+        )
+        self.report_text = ft.Text("", font_family="monospace", size=12, selectable=True)
+        self.status_text = ft.Text("", size=12, color=ft.Colors.GREY_600)
+        self.content = ft.Column(
+            controls=[self.enabled_switch, self.report_text, self.status_text],
+            scroll=ft.ScrollMode.AUTO,
+            width=640,
+            height=420,
+            tight=True,
+        )
+        self.actions = [
+            ft.TextButton("更新", on_click=lambda e: self.refresh()),
+            ft.TextButton("ファイルに保存", on_click=self._on_dump),
+            ft.TextButton("リセット", on_click=self._on_reset),
+            ft.TextButton("閉じる", on_click=lambda e: e.page.close(self)),
+        ]
+
+    def refresh(self, status=""):
+        """最新の集計結果を表示"""
+        self.enabled_switch.value = weather_timing.is_enabled()
+        self.report_text.value = weather_timing.format_report()
+        self.status_text.value = status
+        if self.page:
+            self.update()
+
+    def _on_toggle(self, e):
+        weather_timing.enable(e.control.value)
+        self.refresh()
+
+    def _on_dump(self, e):
+        path = weather_timing.dump(self.dump_path)
+        self.refresh(f"保存しました: {path}")
+
+    def _on_reset(self, e):
+        weather_timing.reset()
+        self.refresh()